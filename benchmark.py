@@ -0,0 +1,329 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import Pool, get_context
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from parse_manim_docs import DOCS_PATH, iter_html_files, parse_doc
+
+BENCHMARK_RESULTS_DIR = "./benchmark_results"
+RECORDED_RESPONSES_PATH = "./benchmark_fixtures/recorded_responses.json"
+STAGES = ("parse", "chunk", "ingest", "retrieve", "generate", "render")
+
+BENCH_SCRIPT = (
+    "Introduction Scene (5 seconds): Text: 'Welcome to Binary Search' (large font, center screen). "
+    "Animation: Text appears with a Write effect. Transition: The text fades out. "
+    "Sorted Array (10 seconds): Text: '[3, 7, 10, 15, 19, 23, 27]' (displayed horizontally). "
+    "Animation: Values are written out one by one, then the middle value is highlighted with a "
+    "SurroundingRectangle. Duration: 4 seconds. Transition: Everything fades out. "
+    "Pointers (10 seconds): Show 'low' and 'high' pointers as an Arrow below each end of the array. "
+    "Animation: The arrows move toward the middle with a Transform. Duration: 6 seconds. "
+    "Conclusion Scene (5 seconds): Text: 'Binary Search runs in O(log n)' (center screen). "
+    "Animation: Text appears with a FadeIn effect. Transition: Text fades out."
+)
+
+
+def fixture_files(docs_root: str = DOCS_PATH, count: int = 40) -> List[str]:
+    """The fixed HTML fixture set: the first `count` pages of the committed docs mirror, by path"""
+    return sorted(iter_html_files(docs_root))[:count]
+
+
+def latency_summary(seconds: List[float]) -> Dict[str, float]:
+    if not seconds:
+        return {"p50_ms": None, "p95_ms": None}
+    ms = np.array(seconds) * 1000
+    return {"p50_ms": round(float(np.percentile(ms, 50)), 3), "p95_ms": round(float(np.percentile(ms, 95)), 3)}
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process; each stage runs in a fresh process"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def timed(items: List, fn: Callable) -> Dict:
+    """Calls fn on every item; returns total seconds, per-item latencies and throughput"""
+    latencies = []
+    results = []
+    started = time.perf_counter()
+    for item in items:
+        item_started = time.perf_counter()
+        results.append(fn(item))
+        latencies.append(time.perf_counter() - item_started)
+    seconds = time.perf_counter() - started
+    return {
+        "results": results,
+        "metrics": dict(items=len(items), seconds=round(seconds, 4),
+                        throughput_per_s=round(len(items) / seconds, 3) if seconds else None,
+                        **latency_summary(latencies))
+    }
+
+
+def bench_parse(work_dir: str, options: Dict) -> Dict:
+    files = fixture_files(options["docs_root"], options["docs"])
+    run = timed(files, parse_doc)
+    with open(os.path.join(work_dir, "docs.jsonl"), "w", encoding="utf-8") as f:
+        for doc in run["results"]:
+            f.write(json.dumps(doc, ensure_ascii=False) + "\n")
+
+    # Same files through the process pool used by parse_manim_docs.py --parallel
+    started = time.perf_counter()
+    with Pool(processes=options["workers"]) as pool:
+        parsed = sum(1 for _ in pool.imap_unordered(parse_doc, files, chunksize=4))
+    parallel_seconds = time.perf_counter() - started
+    return dict(run["metrics"], unit="page", parallel_throughput_per_s=round(parsed / parallel_seconds, 3))
+
+
+def bench_chunk(work_dir: str, options: Dict) -> Dict:
+    from docs_to_db import chunk_document, get_chunker, load_docs
+
+    docs = list(load_docs(os.path.join(work_dir, "docs.jsonl")))
+    get_chunker()  # Loading the encoding is setup, not chunking
+    run = timed(docs, chunk_document)
+    chunks = sum(len(chunks) for chunks in run["results"])
+    return dict(run["metrics"], unit="page", chunks=chunks,
+                chunks_per_s=round(chunks / run["metrics"]["seconds"], 3) if run["metrics"]["seconds"] else None)
+
+
+class _TimedEmbedder:
+    """Records the latency of every encode() call of the wrapped model"""
+
+    def __init__(self, model):
+        self.model = model
+        self.latencies = []
+
+    def encode(self, texts, **kwargs):
+        started = time.perf_counter()
+        embeddings = self.model.encode(texts, **kwargs)
+        self.latencies.append(time.perf_counter() - started)
+        return embeddings
+
+
+def bench_ingest(work_dir: str, options: Dict) -> Dict:
+    import chromadb
+    from sentence_transformers import SentenceTransformer
+    from bm25_index import build_from_collection, bm25_path
+    from docs_to_db import iter_chunk_stream, load_docs, run_ingest_pipeline
+    from embedding_cache import MODEL_NAME
+
+    docs = load_docs(os.path.join(work_dir, "docs.jsonl"))
+    model = _TimedEmbedder(SentenceTransformer(MODEL_NAME))
+    collection = chromadb.PersistentClient(path=os.path.join(work_dir, "chroma_db")).get_or_create_collection(
+        "manim_docs"
+    )
+
+    started = time.perf_counter()
+    stored = run_ingest_pipeline(collection, model, iter_chunk_stream(docs))
+    seconds = time.perf_counter() - started
+    bm25_started = time.perf_counter()
+    build_from_collection(collection, bm25_path(os.path.join(work_dir, "chroma_db")))
+    return dict(items=stored, unit="chunk", seconds=round(seconds, 4),
+                throughput_per_s=round(stored / seconds, 3) if seconds else None,
+                batches=len(model.latencies), **{f"batch_{k}": v for k, v in latency_summary(model.latencies).items()},
+                bm25_seconds=round(time.perf_counter() - bm25_started, 4))
+
+
+def _retriever(work_dir: str):
+    from retrieval import Retriever
+
+    return Retriever(chroma_path=os.path.join(work_dir, "chroma_db"),
+                     cache_path=os.path.join(work_dir, "query_cache"))
+
+
+def bench_retrieve(work_dir: str, options: Dict) -> Dict:
+    from retrieval import scene_query_text
+    from scene_parser import GenericSceneParser
+
+    retriever = _retriever(work_dir)
+    retriever.warm_up()
+    scene_queries = [scene_query_text(scene) for scene in GenericSceneParser().parse_script(BENCH_SCRIPT)]
+    # Distinct texts, so the query embedding cache cannot answer later passes
+    queries = [f"{text} #{i}" for i, text in enumerate(scene_queries * options["repeat"])]
+    run = timed(queries, lambda text: retriever.query([text], n_results=5))
+
+    batch = [f"{text} (batched)" for text in queries]
+    started = time.perf_counter()
+    retriever.query(batch, n_results=5)
+    batch_seconds = time.perf_counter() - started
+    retriever.close()
+    return dict(run["metrics"], unit="query", batched_throughput_per_s=round(len(queries) / batch_seconds, 3))
+
+
+def bench_generate(work_dir: str, options: Dict) -> Dict:
+    from enhanced_RAG import EducationalVideoGenerator
+    from stub_llm_server import StubLLMServer, prompt_key
+
+    recording = options.get("record_to")
+    stub = None
+    if recording:
+        api_key, base_url = os.getenv("API_KEY"), options["llm_base_url"]
+    else:
+        recorded = options["recorded"] if os.path.isfile(options["recorded"]) else None
+        stub = StubLLMServer(port=0, latency=options["llm_latency"], recorded_path=recorded).start()
+        api_key, base_url = "benchmark", stub.base_url
+
+    generator = None
+    try:
+        # Templates off, so the sync and async runs send the same scenes to the LLM
+        generator = EducationalVideoGenerator(api_key, base_url, retriever=_retriever(work_dir), templates=False)
+        scenes = generator.parser.parse_script(BENCH_SCRIPT)
+        # Retrieval is measured by its own stage; build the prompts up front
+        prompts = [generator.generate_scene_prompt(scene, documents)
+                   for scene, documents in zip(scenes, generator.retrieve_contexts(scenes))]
+        run = timed(prompts, generator._complete)
+
+        if recording:
+            responses = {prompt_key([{"role": "user", "content": p}]): c for p, c in zip(prompts, run["results"])}
+            os.makedirs(os.path.dirname(recording) or ".", exist_ok=True)
+            with open(recording, "w", encoding="utf-8") as f:
+                json.dump(responses, f, indent=2)
+
+        scene_code = [generator.clean_scene_code(content, i) for i, content in enumerate(run["results"])]
+        with open(os.path.join(work_dir, "generated_video.py"), "w", encoding="utf-8") as f:
+            f.write(generator.assemble_code(scene_code))
+
+        async_seconds = None
+        if not recording:
+            # The whole script through the concurrent path (retrieval included), replayed by the stub
+            async def generate_async():
+                try:
+                    await generator.generate_code_async(BENCH_SCRIPT, max_concurrency=len(scenes))
+                finally:
+                    await generator.aclose()
+
+            started = time.perf_counter()
+            asyncio.run(generate_async())
+            async_seconds = round(time.perf_counter() - started, 4)
+        # Requests the fixtures answered; the rest got the stub's placeholder scene
+        replay_hit_rate = round(stub.replayed / stub.requests, 3) if stub and stub.requests else None
+        return dict(run["metrics"], unit="scene", async_script_seconds=async_seconds,
+                    llm_requests=stub.requests if stub else None, recorded=not recording and bool(stub.recorded),
+                    replay_hit_rate=replay_hit_rate)
+    finally:
+        if generator is not None:
+            generator.close()
+            generator.retriever.close()
+        if stub is not None:
+            stub.stop()
+
+
+def bench_render(work_dir: str, options: Dict) -> Dict:
+    from render_scenes import render_module
+
+    started = time.perf_counter()
+    result = render_module(os.path.join(work_dir, "generated_video.py"), quality="low_quality",
+                           workers=options["workers"], media_dir=os.path.join(work_dir, "media"), cache_dir=None)
+    seconds = time.perf_counter() - started
+    failures = [scene["error"] for scene in result["scenes"] if scene["error"]]
+    return dict(items=len(result["scenes"]), unit="scene", seconds=round(seconds, 4),
+                throughput_per_s=round(len(result["scenes"]) / seconds, 3) if seconds else None,
+                **latency_summary([scene["seconds"] for scene in result["scenes"]]), failures=failures)
+
+
+def _run_stage(name: str, work_dir: str, options: Dict) -> Dict:
+    """Runs in a fresh process so peak_rss_mb belongs to this stage alone"""
+    metrics = globals()[f"bench_{name}"](work_dir, options)
+    metrics["peak_rss_mb"] = peak_rss_mb()
+    return metrics
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(stages=STAGES, work_dir: Optional[str] = None, **options) -> Dict:
+    """
+    Runs the selected stages in pipeline order, each in its own spawned
+    process; a stage that fails is recorded with its error and the stages
+    that need its output are skipped.
+    """
+    results = {
+        "commit": _git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "options": options,
+        "stages": {}
+    }
+    failed = False
+    with tempfile.TemporaryDirectory(prefix="edutok-bench-") as tmp_dir:
+        work_dir = work_dir or tmp_dir
+        os.makedirs(work_dir, exist_ok=True)
+        for name in STAGES:
+            if name not in stages:
+                continue
+            if failed:
+                results["stages"][name] = {"skipped": "an earlier stage failed"}
+                continue
+            print(f"Benchmarking {name}...")
+            with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+                try:
+                    results["stages"][name] = pool.submit(_run_stage, name, work_dir, options).result()
+                except Exception as e:
+                    results["stages"][name] = {"error": f"{type(e).__name__}: {e}"}
+                    failed = True
+            print(f"  {json.dumps(results['stages'][name])}")
+    return results
+
+
+def compare(baseline: Dict, current: Dict) -> List[str]:
+    """One line per stage metric that both runs have, with the relative change"""
+    lines = []
+    for stage, metrics in current["stages"].items():
+        old = baseline.get("stages", {}).get(stage, {})
+        for key in ("throughput_per_s", "p50_ms", "p95_ms", "peak_rss_mb"):
+            if isinstance(metrics.get(key), (int, float)) and isinstance(old.get(key), (int, float)) and old[key]:
+                change = (metrics[key] - old[key]) / old[key] * 100
+                lines.append(f"{stage:>9} {key:<17} {old[key]:>12} -> {metrics[key]:<12} ({change:+.1f}%)")
+    return lines
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Benchmark each stage of the pipeline on fixed fixtures.")
+    arg_parser.add_argument("stages", nargs="*", help=f"Stages to run (default: all of {', '.join(STAGES)})")
+    arg_parser.add_argument("--docs-root", default=DOCS_PATH)
+    arg_parser.add_argument("--docs", type=int, default=40, help="Number of fixture pages")
+    arg_parser.add_argument("--workers", type=int, default=None)
+    arg_parser.add_argument("--repeat", type=int, default=5, help="Passes over the retrieval queries")
+    arg_parser.add_argument("--recorded", default=RECORDED_RESPONSES_PATH)
+    arg_parser.add_argument("--llm-latency", type=float, default=0.0, help="Stub LLM delay per request (s)")
+    arg_parser.add_argument("--record", action="store_true",
+                            help="Call the real API (API_KEY) and save its responses to --recorded")
+    arg_parser.add_argument("--llm-base-url", default="https://api.deepseek.com")
+    arg_parser.add_argument("--work-dir", default=None, help="Keep intermediate outputs here")
+    arg_parser.add_argument("--output", default=None)
+    arg_parser.add_argument("--compare", default=None, help="Earlier results JSON to compare against")
+    args = arg_parser.parse_args()
+    unknown = set(args.stages) - set(STAGES)
+    if unknown:
+        arg_parser.error(f"unknown stages: {', '.join(sorted(unknown))}")
+
+    results = run_benchmarks(
+        args.stages or list(STAGES), args.work_dir, docs_root=args.docs_root, docs=args.docs,
+        workers=args.workers, repeat=args.repeat, recorded=args.recorded, llm_latency=args.llm_latency,
+        llm_base_url=args.llm_base_url, record_to=args.recorded if args.record else None
+    )
+    output = args.output or os.path.join(BENCHMARK_RESULTS_DIR, f"{results['commit'] or 'unknown'}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            print("\n".join(compare(json.load(f), results)))
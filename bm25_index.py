@@ -0,0 +1,151 @@
+import os
+import re
+from collections import Counter, defaultdict
+from typing import Iterable, List, Tuple
+
+import numpy as np
+
+# Stored inside the Chroma directory it indexes, so the two always move together
+BM25_FILENAME = "bm25_index.npz"
+
+# Identifiers are kept whole (FadeIn, VGroup.arrange) and also split on dots
+TOKEN_PATTERN = re.compile(r'[A-Za-z_][A-Za-z0-9_]*(?:\.[A-Za-z_][A-Za-z0-9_]*)*|\d+')
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has in is it its of on or that the this to was were will with".split()
+)
+
+
+def bm25_path(chroma_path: str) -> str:
+    """Where the lexical index of the collection at chroma_path lives"""
+    return os.path.join(chroma_path, BM25_FILENAME)
+
+
+def tokenize(text: str) -> List[str]:
+    tokens = []
+    for match in TOKEN_PATTERN.finditer(text):
+        token = match.group(0).lower()
+        if token in STOPWORDS:
+            continue
+        tokens.append(token)
+        if "." in token:
+            tokens.extend(part for part in token.split(".") if part not in STOPWORDS)
+    return tokens
+
+
+class BM25Index:
+    """
+    Okapi BM25 over the ingested chunks. Postings are stored CSR-style in
+    flat numpy arrays so the whole index saves to and loads from one .npz.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.doc_ids: List[str] = []
+        self.doc_lengths = np.zeros(0, dtype=np.int32)
+        self.term_index = {}
+        self.term_offsets = np.zeros(1, dtype=np.int64)
+        self.postings_docs = np.zeros(0, dtype=np.int32)
+        self.postings_tfs = np.zeros(0, dtype=np.float32)
+        self.avg_length = 0.0
+
+    @classmethod
+    def build(cls, documents: Iterable[Tuple[str, str]], k1: float = 1.5, b: float = 0.75) -> "BM25Index":
+        """Builds the index from (doc_id, text) pairs"""
+        index = cls(k1, b)
+        postings = defaultdict(list)
+        lengths = []
+        for doc_number, (doc_id, text) in enumerate(documents):
+            counts = Counter(tokenize(text))
+            index.doc_ids.append(doc_id)
+            lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                postings[term].append((doc_number, tf))
+
+        terms = sorted(postings)
+        index.term_index = {term: i for i, term in enumerate(terms)}
+        index.term_offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        index.term_offsets[1:] = np.cumsum([len(postings[term]) for term in terms])
+        flat = [entry for term in terms for entry in postings[term]]
+        index.postings_docs = np.array([doc for doc, _ in flat], dtype=np.int32)
+        index.postings_tfs = np.array([tf for _, tf in flat], dtype=np.float32)
+        index.doc_lengths = np.array(lengths, dtype=np.int32)
+        index.avg_length = float(index.doc_lengths.mean()) if lengths else 0.0
+        return index
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[str, float]]:
+        """Returns up to k (doc_id, score) pairs, best first"""
+        if not self.doc_ids:
+            return []
+        scores = np.zeros(len(self.doc_ids), dtype=np.float32)
+        n_docs = len(self.doc_ids)
+        # Every document may be empty after tokenizing; avoid dividing by a zero average
+        avg_length = self.avg_length or 1.0
+        for term in set(tokenize(query)):
+            term_id = self.term_index.get(term)
+            if term_id is None:
+                continue
+            start, end = self.term_offsets[term_id], self.term_offsets[term_id + 1]
+            docs = self.postings_docs[start:end]
+            tfs = self.postings_tfs[start:end]
+            idf = np.log(1 + (n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[docs] / avg_length)
+            scores[docs] += idf * tfs * (self.k1 + 1) / (tfs + norm)
+
+        k = min(k, n_docs)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.doc_ids[i], float(scores[i])) for i in top if scores[i] > 0]
+
+    def save(self, path: str):
+        tmp_path = path + ".tmp.npz"
+        np.savez(
+            tmp_path,
+            params=np.array([self.k1, self.b]),
+            doc_ids=np.array(self.doc_ids, dtype=str),
+            doc_lengths=self.doc_lengths,
+            terms=np.array(sorted(self.term_index, key=self.term_index.get), dtype=str),
+            term_offsets=self.term_offsets,
+            postings_docs=self.postings_docs,
+            postings_tfs=self.postings_tfs
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        with np.load(path) as data:
+            index = cls(*data["params"].tolist())
+            index.doc_ids = data["doc_ids"].tolist()
+            index.doc_lengths = data["doc_lengths"]
+            index.term_index = {term: i for i, term in enumerate(data["terms"].tolist())}
+            index.term_offsets = data["term_offsets"]
+            index.postings_docs = data["postings_docs"]
+            index.postings_tfs = data["postings_tfs"]
+        index.avg_length = float(index.doc_lengths.mean()) if len(index.doc_lengths) else 0.0
+        return index
+
+
+def iter_collection_documents(collection, page_size: int = 5000):
+    """Yields (id, document) for every chunk in a Chroma collection, page by page"""
+    offset = 0
+    while True:
+        page = collection.get(include=["documents"], limit=page_size, offset=offset)
+        if not page["ids"]:
+            return
+        yield from zip(page["ids"], page["documents"])
+        offset += len(page["ids"])
+
+
+def build_from_collection(collection, path: str) -> BM25Index:
+    index = BM25Index.build(iter_collection_documents(collection))
+    index.save(path)
+    return index
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """Fuses ranked id lists: score(d) = sum over lists of 1 / (k + rank)"""
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] += 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
@@ -0,0 +1,100 @@
+import re
+from typing import Callable, List, Optional
+
+FENCE_PATTERN = re.compile(r'^\s*```')
+# Imports, class/def headers and decorators; a leading "#" is prose (a markdown heading) until code has started
+CODE_START_PATTERN = re.compile(
+    r'^(from\s+[\w.]+\s+import\s|import\s+[\w.]+|class\s+\w+\s*[(:]|(async\s+)?def\s+\w+\s*\(|@[\w.]+)'
+)
+CLASS_PATTERN = re.compile(r'^class\s+\w+')
+# Cached responses may carry another scene's index (see EducationalVideoGenerator.clean_scene_code)
+SCENE_CLASS_PATTERN = re.compile(r'class\s+Scene\d*\s*\(Scene\)')
+
+
+class SceneCodeStream:
+    """
+    Incrementally extracts Manim code from a streamed LLM completion.
+
+    Text deltas are fed in as they arrive. Everything inside the first fenced
+    block (or, if the model skipped the fence, everything from the first
+    import, class, def or decorator line) is kept as code.
+    `class Scene(Scene)` is renamed to `class Scene{index}(Scene)` line by
+    line, and each top-level class (with its decorators) is handed to
+    on_class as soon as it is closed by a dedent, the closing fence or the
+    end of the stream.
+    """
+
+    def __init__(self, index: int, on_class: Optional[Callable[[str], None]] = None):
+        self.index = index
+        self.on_class = on_class
+        self.classes: List[str] = []
+        self._lines: List[str] = []
+        self._class_lines: Optional[List[str]] = None
+        # Decorator lines waiting for the class or def they belong to
+        self._decorators: List[str] = []
+        self._partial = ""
+        self._state = "start"  # start -> code (inside fence or unfenced) -> done
+
+    def feed(self, delta: str):
+        self._partial += delta
+        *lines, self._partial = self._partial.split("\n")
+        for line in lines:
+            self._feed_line(line)
+
+    def close(self) -> str:
+        """Flushes the trailing partial line and returns the cleaned code"""
+        if self._partial:
+            self._feed_line(self._partial)
+            self._partial = ""
+        self._finish_class()
+        self._state = "done"
+        return self.code
+
+    @property
+    def code(self) -> str:
+        return "\n".join(self._lines).strip()
+
+    def _feed_line(self, line: str):
+        if self._state == "done":
+            return
+        if FENCE_PATTERN.match(line):
+            if self._state == "start":
+                self._state = "code"
+            else:
+                self._finish_class()
+                self._state = "done"
+            return
+        if self._state == "start":
+            if not CODE_START_PATTERN.match(line):
+                # Blank lines or prose before the code starts
+                return
+            # No opening fence: the model answered with bare code
+            self._state = "code"
+
+        line = SCENE_CLASS_PATTERN.sub(f'class Scene{self.index}(Scene)', line)
+        self._lines.append(line)
+
+        top_level = line.strip() and not line[0].isspace() and not line.lstrip().startswith("#")
+        if top_level:
+            self._finish_class()
+            if line.startswith("@"):
+                self._decorators.append(line)
+                return
+            if CLASS_PATTERN.match(line):
+                self._class_lines = self._decorators
+            self._decorators = []
+        elif self._decorators:
+            # Arguments of a decorator that spans several lines
+            self._decorators.append(line)
+            return
+        if self._class_lines is not None:
+            self._class_lines.append(line)
+
+    def _finish_class(self):
+        if self._class_lines is None:
+            return
+        source = "\n".join(self._class_lines).rstrip()
+        self._class_lines = None
+        self.classes.append(source)
+        if self.on_class is not None:
+            self.on_class(source)
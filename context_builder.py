@@ -0,0 +1,188 @@
+import re
+from typing import Dict, List, Optional
+
+import tiktoken
+
+CONTEXT_TOKEN_BUDGET = 1500
+# Must match the chunking in docs_to_db.py, for chunks stored without token offsets
+CHUNK_OVERLAP = {"text": 50, "code": 30}
+DUPLICATE_THRESHOLD = 0.8
+MIN_SNIPPET_TOKENS = 64
+CONTEXT_HEADER = "\nReference Documents:\n"
+DOCUMENT_HEADER = "--- Document {number} ---\n"
+
+CHUNK_ID_PATTERN = re.compile(r'^(?P<series>text|code_\d+)_(?P<index>\d+)$')
+WORD_PATTERN = re.compile(r'\w+')
+
+_encoding = None
+
+
+def get_encoding():
+    """The tiktoken encoding the docs were chunked with, loaded on first use"""
+    global _encoding
+    if _encoding is None:
+        _encoding = tiktoken.get_encoding("cl100k_base")
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    return len(get_encoding().encode(text))
+
+
+def _chunk_position(metadata: Dict):
+    """(source, series, index) for chunk ids like text_3 or code_1_0, or None"""
+    match = CHUNK_ID_PATTERN.match(str(metadata.get("chunk_id", "")))
+    if not match or "source" not in metadata:
+        return None
+    return metadata["source"], match.group("series"), int(match.group("index"))
+
+
+def _overlap_tokens(previous: Dict, following: Dict, series: str) -> int:
+    if "token_end" in previous and "token_start" in following:
+        return max(0, previous["token_end"] - following["token_start"])
+    return CHUNK_OVERLAP["code" if series.startswith("code") else "text"]
+
+
+def _stitch(run: List, series: str, encoding) -> List:
+    """
+    Splits a run of consecutive chunks into (members, merged tokens) groups.
+    Neighbours are only joined where the overlapping tokens match exactly,
+    so a shifted boundary never drops real tokens.
+    """
+    groups = []
+    members = [run[0]]
+    tokens = encoding.encode(run[0][1]["content"])
+    for previous, following in zip(run, run[1:]):
+        overlap = _overlap_tokens(previous[1]["metadata"], following[1]["metadata"], series)
+        following_tokens = encoding.encode(following[1]["content"])
+        if overlap and tokens[-overlap:] == following_tokens[:overlap]:
+            members.append(following)
+            tokens.extend(following_tokens[overlap:])
+        else:
+            groups.append((members, tokens))
+            members, tokens = [following], following_tokens
+    groups.append((members, tokens))
+    return groups
+
+
+def merge_adjacent(documents: List[Dict]) -> List[Dict]:
+    """
+    Stitches consecutive chunks of the same source text or code block back
+    together, dropping the overlapping tokens they share where those match.
+    Each merged run takes the rank of its best member; the result keeps
+    that order.
+    """
+    encoding = get_encoding()
+    positions = {}
+    for rank, doc in enumerate(documents):
+        position = _chunk_position(doc.get("metadata") or {})
+        if position is not None:
+            positions.setdefault(position, (rank, doc))
+
+    merged = []
+    seen = set()
+    for rank, doc in enumerate(documents):
+        position = _chunk_position(doc.get("metadata") or {})
+        if position is None:
+            merged.append((rank, doc))
+            continue
+        if position in seen:
+            continue
+
+        # Walk back to the first retrieved chunk of this run, then forward to its end
+        source, series, index = position
+        while (source, series, index - 1) in positions:
+            index -= 1
+        run = []
+        while (source, series, index) in positions:
+            run.append(positions[(source, series, index)])
+            seen.add((source, series, index))
+            index += 1
+
+        for members, tokens in _stitch(run, series, encoding):
+            if len(members) == 1:
+                merged.append(members[0])
+                continue
+            first, last = members[0][1], members[-1][1]
+            metadata = dict(first["metadata"])
+            if "token_end" in last["metadata"]:
+                metadata["token_end"] = last["metadata"]["token_end"]
+            merged.append((min(r for r, _ in members), {
+                "id": "+".join(d["id"] for _, d in members),
+                "content": encoding.decode(tokens),
+                "metadata": metadata
+            }))
+
+    return [doc for _, doc in sorted(merged, key=lambda item: item[0])]
+
+
+def _shingles(text: str, size: int = 5) -> set:
+    words = WORD_PATTERN.findall(text.lower())
+    if len(words) <= size:
+        return {tuple(words)}
+    return {tuple(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def remove_near_duplicates(documents: List[Dict], threshold: float = DUPLICATE_THRESHOLD) -> List[Dict]:
+    """
+    Drops documents whose word 5-gram sets overlap an earlier (better ranked)
+    document's by at least threshold, measured as Jaccard similarity or as
+    containment of the shorter one.
+    """
+    kept = []
+    kept_shingles = []
+    for doc in documents:
+        shingles = _shingles(doc["content"])
+        duplicate = False
+        for other in kept_shingles:
+            common = len(shingles & other)
+            if (common / len(shingles | other) >= threshold
+                    or common / min(len(shingles), len(other)) >= threshold):
+                duplicate = True
+                break
+        if not duplicate:
+            kept.append(doc)
+            kept_shingles.append(shingles)
+    return kept
+
+
+def build_context(documents: List[Dict], token_budget: Optional[int] = CONTEXT_TOKEN_BUDGET,
+                  min_snippet_tokens: int = MIN_SNIPPET_TOKENS) -> List[Dict]:
+    """
+    Turns ranked retrieval hits ({"id", "content", "metadata"}, best first)
+    into prompt context: adjacent chunks are merged, near-duplicates removed,
+    and snippets packed best first into token_budget tokens, including the
+    headers format_context adds. A snippet that does not fit is truncated
+    if at least min_snippet_tokens remain, otherwise skipped in favour of
+    smaller ones further down the list. Pass token_budget=None to only
+    merge and deduplicate.
+    """
+    documents = remove_near_duplicates(merge_adjacent(documents))
+    if token_budget is None:
+        return documents
+
+    encoding = get_encoding()
+    packed = []
+    remaining = token_budget - count_tokens(CONTEXT_HEADER)
+    for doc in documents:
+        # The document's header, plus the newline joining it to the previous section
+        header = count_tokens(DOCUMENT_HEADER.format(number=len(packed) + 1)) + (1 if packed else 0)
+        available = remaining - header
+        tokens = encoding.encode(doc["content"])
+        if len(tokens) <= available:
+            packed.append(doc)
+            remaining = available - len(tokens)
+        elif available >= min_snippet_tokens:
+            packed.append(dict(doc, content=encoding.decode(tokens[:available])))
+            remaining = 0
+        if remaining <= 0:
+            break
+    return packed
+
+
+def format_context(documents: List[Dict]) -> str:
+    """Numbered reference section for a prompt, empty when there are no documents"""
+    if not documents:
+        return ""
+    sections = [DOCUMENT_HEADER.format(number=i) + doc["content"] for i, doc in enumerate(documents, start=1)]
+    return CONTEXT_HEADER + "\n".join(sections) + "\n"
@@ -1,36 +1,282 @@
+import argparse
+import contextvars
 import json
 import os
+import hashlib
+import queue
+import threading
+from itertools import chain
+from multiprocessing import Pool
+from multiprocessing.pool import ThreadPool
+import numpy as np
 import tiktoken 
 from sentence_transformers import SentenceTransformer
 import chromadb
+from embedding_cache import CachedEmbedder, EmbeddingCache, MODEL_NAME, INGEST_CACHE_PATH
+from bm25_index import build_from_collection, bm25_path
+from quantized_index import build_from_collection as build_quantized_index, has_exact_vectors, quantized_index_path
+from tracing import span
 import time
 
 JSON_PATH = "manim-docs/docs.manim.community/manim_docs.json"
+MANIFEST_PATH = "./ingest_manifest.json"
+EMBED_BATCH_SIZE = 256
+
+class TokenChunker:
+    """
+    Splits texts into overlapping token windows with a single tiktoken
+    encoding. Texts are encoded with encode_batch and the windows of each
+    text are decoded with decode_batch instead of one call per window.
+    """
+
+    def __init__(self, encoding_name="cl100k_base", num_threads=8):
+        self.encoding = tiktoken.get_encoding(encoding_name)
+        self.num_threads = num_threads
+
+    def iter_chunks(self, texts, chunk_size=500, overlap=50):
+        """
+        Yields (text_index, chunk_index, token_start, token_end, chunk_str)
+        for every window of every text, in order.
+        """
+        step = chunk_size - overlap
+        token_lists = self.encoding.encode_batch(texts, num_threads=self.num_threads)
+        for text_idx, tokens in enumerate(token_lists):
+            windows = [(start, min(start + chunk_size, len(tokens))) for start in range(0, len(tokens), step)]
+            decoded = self.encoding.decode_batch(
+                [tokens[start:end] for start, end in windows], num_threads=self.num_threads
+            )
+            for chunk_idx, ((start, end), chunk_str) in enumerate(zip(windows, decoded)):
+                yield text_idx, chunk_idx, start, end, chunk_str
+
+_chunker = None
+
+def get_chunker():
+    """Returns this process's TokenChunker, loading the encoding on first use."""
+    global _chunker
+    if _chunker is None:
+        _chunker = TokenChunker()
+    return _chunker
 
 def chunk_text_tiktoken(text, chunk_size=500, overlap=50):
     """
     Splits text into chunks of ~chunk_size tokens using tiktoken.
     Overlaps each chunk by 'overlap' tokens for context continuity.
     """
-    encoding = tiktoken.get_encoding("cl100k_base")
-    tokens = encoding.encode(text)
+    return [chunk_str for *_, chunk_str in get_chunker().iter_chunks([text], chunk_size, overlap)]
+
+def batch_iterable(iterable, batch_size):
+    for i in range(0, len(iterable), batch_size):
+        yield iterable[i:i + batch_size]
+
+def batch_stream(iterable, batch_size):
+    """Like batch_iterable, but for generators of unknown length."""
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def load_docs(path):
+    """
+    Yields parsed docs from either the manim_docs.json array written by
+    parse_manim_docs.main() or the JSON Lines file from main_parallel().
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from json.load(f)
+
+def chunk_document(doc):
+    """Splits one parsed doc into text and code chunks."""
+    file_path = doc.get("file_path", "unknown_path")
+    text_content = doc.get("text", "")
+    code_blocks = doc.get("code_blocks", [])
+    chunker = get_chunker()
     chunks = []
 
-    idx = 0
-    while idx < len(tokens):
-        end = idx + chunk_size
-        chunk_slice = tokens[idx:end]
-        chunk_str = encoding.decode(chunk_slice)
-        chunks.append(chunk_str)
-        idx += chunk_size - overlap
+    # Chunk the main text
+    for _, i, start, end, chunk_str in chunker.iter_chunks([text_content], chunk_size=500, overlap=50):
+        chunks.append({
+            "source": file_path,
+            "chunk_id": f"text_{i}",
+            "content": chunk_str,
+            "token_start": start,
+            "token_end": end
+        })
+
+    # Chunk all code blocks of the doc in one batch
+    for j, k, start, end, chunk_str in chunker.iter_chunks(code_blocks, chunk_size=300, overlap=30):
+        chunks.append({
+            "source": file_path,
+            "chunk_id": f"code_{j}_{k}",
+            "content": chunk_str,
+            "token_start": start,
+            "token_end": end
+        })
 
     return chunks
 
-def batch_iterable(iterable, batch_size):
-    for i in range(0, len(iterable), batch_size):
-        yield iterable[i:i + batch_size]
+def iter_chunk_stream(docs, workers=0, processes=False, chunksize=16):
+    """
+    Yields chunks for a stream of docs in doc order. With workers > 0 the docs
+    are chunked on a thread pool, or on a process pool when processes=True
+    (each worker process loads its own encoding once).
+    """
+    if not workers:
+        for doc in docs:
+            yield from chunk_document(doc)
+        return
+
+    pool_cls = Pool if processes else ThreadPool
+    with pool_cls(workers) as pool:
+        yield from chain.from_iterable(pool.imap(chunk_document, docs, chunksize=chunksize))
+
+def chunk_metadata(chunk):
+    return {
+        "source": chunk["source"],
+        "chunk_id": chunk["chunk_id"],
+        "token_start": chunk["token_start"],
+        "token_end": chunk["token_end"]
+    }
+
+def chunk_key(chunk):
+    return f"{chunk['source']}_{chunk['chunk_id']}"
+
+def content_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
 
-def main():
+def doc_hash(doc):
+    return content_hash(json.dumps([doc.get("text", ""), doc.get("code_blocks", [])], ensure_ascii=False))
+
+def collection_ids(collection, page_size=5000):
+    """Yields the id of every chunk stored in the collection, page by page"""
+    offset = 0
+    while True:
+        page = collection.get(include=[], limit=page_size, offset=offset)
+        if not page["ids"]:
+            return
+        yield from page["ids"]
+        offset += len(page["ids"])
+
+def load_manifest(path=MANIFEST_PATH):
+    if not os.path.isfile(path):
+        return {"files": {}}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_manifest(manifest, path=MANIFEST_PATH):
+    # Write to a temp file first so an interrupted run never leaves a torn manifest
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, path)
+
+_DONE = object()
+
+def _put(q, item, stop):
+    """Blocking put that gives up once another pipeline stage has failed."""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+def _get(q, stop):
+    while not stop.is_set():
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            continue
+    return _DONE
+
+def run_ingest_pipeline(collection, model, chunks, embed_batch_size=EMBED_BATCH_SIZE, queue_size=4):
+    """
+    Chunks, embeds and stores as three overlapping stages connected by
+    bounded queues: a producer thread batches the chunk stream, the calling
+    thread embeds each batch, and a writer thread upserts the float32
+    embedding arrays into Chroma. At most queue_size batches wait between
+    stages, so memory stays flat regardless of corpus size.
+    Returns the number of chunks stored.
+    """
+    chunk_queue = queue.Queue(maxsize=queue_size)
+    store_queue = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    errors = []
+    stored = 0
+
+    def produce():
+        try:
+            batches = batch_stream(chunks, embed_batch_size)
+            while True:
+                # Time spent pulling a batch out of the lazy chunk stream is the chunking work
+                with span("chunk") as chunk_span:
+                    batch = next(batches, None)
+                    chunk_span.set(chunks=len(batch or ()))
+                if batch is None:
+                    return
+                if not _put(chunk_queue, batch, stop):
+                    return
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            _put(chunk_queue, _DONE, stop)
+
+    def store():
+        nonlocal stored
+        try:
+            while (item := _get(store_queue, stop)) is not _DONE:
+                batch, embeddings = item
+                with span("store", chunks=len(batch)):
+                    collection.upsert(
+                        documents=[chunk["content"] for chunk in batch],
+                        embeddings=embeddings,
+                        ids=[chunk_key(chunk) for chunk in batch],
+                        metadatas=[chunk_metadata(chunk) for chunk in batch]
+                    )
+                stored += len(batch)
+                print(f"Stored {stored} chunks")
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+
+    # Run the stage threads in copies of this context so their spans join the caller's trace
+    producer = threading.Thread(target=contextvars.copy_context().run, args=(produce,), daemon=True)
+    writer = threading.Thread(target=contextvars.copy_context().run, args=(store,), daemon=True)
+    producer.start()
+    writer.start()
+
+    try:
+        while (batch := _get(chunk_queue, stop)) is not _DONE:
+            with span("embed", chunks=len(batch)):
+                embeddings = model.encode(
+                    [chunk["content"] for chunk in batch],
+                    batch_size=embed_batch_size,
+                    convert_to_numpy=True
+                ).astype(np.float32, copy=False)
+            if not _put(store_queue, (batch, embeddings), stop):
+                break
+    except Exception:
+        stop.set()
+        raise
+    finally:
+        _put(store_queue, _DONE, stop)
+        producer.join()
+        writer.join()
+
+    if errors:
+        raise errors[0]
+    return stored
+
+def main(json_path=JSON_PATH, manifest_path=MANIFEST_PATH, max_batch_size=5460, quantized=False, exact_vectors=False):
     print("Current Working Directory:", os.getcwd())
     
     print("Initializing ChromaDB...")
@@ -44,79 +290,56 @@ def main():
         print(f"Failed to connect to ChromaDB: {str(e)}")
         return
 
-    # Load the Manim docs from JSON
-    if not os.path.isfile(JSON_PATH):
-        print(f"ERROR: JSON file not found at {JSON_PATH}")
+    # Load the Manim docs from JSON (or the JSON Lines of parse_manim_docs.py --parallel)
+    if not os.path.isfile(json_path):
+        print(f"ERROR: JSON file not found at {json_path}")
         return
 
     print("Loading JSON file...")
-    with open(JSON_PATH, "r", encoding="utf-8") as f:
-        manim_docs = json.load(f)
+    manim_docs = load_docs(json_path)
+
+    model = CachedEmbedder(SentenceTransformer(MODEL_NAME), EmbeddingCache(INGEST_CACHE_PATH))
+    collection = client.get_or_create_collection("manim_docs")
 
-    all_chunks = []
+    # Record the manifest as docs stream through, so a later --incremental run starts from this one
+    manifest_files = {}
 
+    def recorded_docs():
+        for doc in manim_docs:
+            manifest_files[doc.get("file_path", "unknown_path")] = {"hash": doc_hash(doc), "chunks": {}}
+            yield doc
+
+    def recorded_chunks():
+        for chunk in iter_chunk_stream(recorded_docs()):
+            manifest_files[chunk["source"]]["chunks"][chunk_key(chunk)] = content_hash(chunk["content"])
+            yield chunk
+
+    # Chunk, embed and store as overlapping stages
     print("Processing documents...")
-    for doc in manim_docs:
-        file_path = doc.get("file_path", "unknown_path")
-        text_content = doc.get("text", "")
-        code_blocks = doc.get("code_blocks", [])
-
-        # Chunk the main text
-        text_chunks = chunk_text_tiktoken(text_content, chunk_size=500, overlap=50)
-        for i, chunk_str in enumerate(text_chunks):
-            all_chunks.append({
-                "source": file_path,
-                "chunk_id": f"text_{i}",
-                "content": chunk_str
-            })
-
-        # Chunk the code blocks
-        for j, code_block_text in enumerate(code_blocks):
-            code_chunks = chunk_text_tiktoken(code_block_text, chunk_size=300, overlap=30)
-            for k, chunk_str in enumerate(code_chunks):
-                all_chunks.append({
-                    "source": file_path,
-                    "chunk_id": f"code_{j}_{k}",
-                    "content": chunk_str
-                })
-
-    print(f"Created {len(all_chunks)} total chunks.")
-
-    # Create embeddings
-    print("Creating embeddings...")
-    model = SentenceTransformer("all-MiniLM-L6-v2")
-    texts_for_embedding = [chunk["content"] for chunk in all_chunks]
-    embeddings = model.encode(texts_for_embedding, show_progress_bar=True)
-
-    # Create or get collection
-    collection = client.get_or_create_collection("manim_docs")
-    
-    print("Preparing data for storage...")
-    ids = [f"{chunk['source']}_{chunk['chunk_id']}" for chunk in all_chunks]
-    docs = [chunk["content"] for chunk in all_chunks]
-    metas = [{"source": chunk["source"], "chunk_id": chunk["chunk_id"]} for chunk in all_chunks]
-    embs = [emb.tolist() for emb in embeddings]
-
-    # Store data in batches
-    print("Storing data in batches...")
-    max_batch_size = 5460
-    batch_count = 0
-    for batch_ids, batch_docs, batch_metas, batch_embs in zip(
-        batch_iterable(ids, max_batch_size),
-        batch_iterable(docs, max_batch_size),
-        batch_iterable(metas, max_batch_size),
-        batch_iterable(embs, max_batch_size),
-    ):
-        collection.add(
-            documents=batch_docs,
-            embeddings=batch_embs,
-            ids=batch_ids,
-            metadatas=batch_metas
-        )
-        batch_count += 1
-        print(f"Processed batch {batch_count}")
-        
-        client.heartbeat()
+    with span("ingest"):
+        stored = run_ingest_pipeline(collection, model, recorded_chunks())
+    model.cache.flush()
+    print(f"Created and stored {stored} total chunks.")
+
+    # Chunks of docs that are gone (or shrank) since the collection was last filled
+    kept_ids = {key for entry in manifest_files.values() for key in entry["chunks"]}
+    stale_ids = [doc_id for doc_id in collection_ids(collection) if doc_id not in kept_ids]
+    for batch in batch_iterable(stale_ids, max_batch_size):
+        collection.delete(ids=batch)
+    if stale_ids:
+        print(f"Deleted {len(stale_ids)} stale chunks.")
+    save_manifest({"files": manifest_files}, manifest_path)
+
+    # Lexical index for exact API names, fused with vector search at query time
+    bm25 = build_from_collection(collection, bm25_path(chroma_path))
+    print(f"BM25 index built over {len(bm25.doc_ids)} chunks at {bm25_path(chroma_path)}")
+
+    quantized_path = quantized_index_path(chroma_path)
+    if quantized or os.path.isdir(quantized_path):
+        # Optional int8 index for Retriever(quantized_path=...); an existing one is rebuilt so it
+        # never lists chunks the collection no longer has, keeping its exact vectors if it had them
+        index = build_quantized_index(collection, quantized_path, exact_vectors or has_exact_vectors(quantized_path))
+        print(f"Quantized index built over {len(index)} chunks at {quantized_path}")
 
     print("\nVerifying storage...")
     try:
@@ -141,5 +364,89 @@ def main():
 
     print("All done!")
 
+def main_incremental(json_path=JSON_PATH, chroma_path="./chroma_db", manifest_path=MANIFEST_PATH,
+                     max_batch_size=5460, quantized=False, exact_vectors=False):
+    """
+    Re-ingests only what changed since the last run. The manifest records a
+    hash per source file and per chunk; unchanged files are skipped, new or
+    changed chunks are embedded and upserted, and chunks whose file (or
+    position in a file) disappeared are deleted from the collection.
+    """
+    if not os.path.isfile(json_path):
+        print(f"ERROR: JSON file not found at {json_path}")
+        return
+
+    client = chromadb.PersistentClient(path=chroma_path)
+    collection = client.get_or_create_collection("manim_docs")
+    manifest = load_manifest(manifest_path)
+    old_files = manifest["files"]
+    new_files = {}
+
+    stale_ids = []
+    skipped = 0
+
+    def changed_chunks():
+        nonlocal skipped
+        for doc in load_docs(json_path):
+            source = doc.get("file_path", "unknown_path")
+            file_hash = doc_hash(doc)
+            old_entry = old_files.get(source)
+
+            if old_entry and old_entry["hash"] == file_hash:
+                new_files[source] = old_entry
+                skipped += 1
+                continue
+
+            old_chunks = old_entry["chunks"] if old_entry else {}
+            new_chunks = {}
+            for chunk in chunk_document(doc):
+                key = chunk_key(chunk)
+                chunk_hash = content_hash(chunk["content"])
+                new_chunks[key] = chunk_hash
+                if old_chunks.get(key) != chunk_hash:
+                    yield chunk
+
+            stale_ids.extend(key for key in old_chunks if key not in new_chunks)
+            new_files[source] = {"hash": file_hash, "chunks": new_chunks}
+
+    print("Diffing documents against manifest...")
+    model = CachedEmbedder(SentenceTransformer(MODEL_NAME), EmbeddingCache(INGEST_CACHE_PATH))
+    with span("ingest", incremental=True):
+        upserted = run_ingest_pipeline(collection, model, changed_chunks())
+    model.cache.flush()
+
+    # Files that vanished from the docs mirror take all of their chunks with them
+    for source, entry in old_files.items():
+        if source not in new_files:
+            stale_ids.extend(entry["chunks"])
+
+    for batch in batch_iterable(stale_ids, max_batch_size):
+        collection.delete(ids=batch)
+
+    manifest["files"] = new_files
+    save_manifest(manifest, manifest_path)
+
+    if upserted or stale_ids or not os.path.isfile(bm25_path(chroma_path)):
+        build_from_collection(collection, bm25_path(chroma_path))
+    # An existing int8 index is rebuilt whenever the collection changes, with or without --quantized
+    quantized_path = quantized_index_path(chroma_path)
+    quantized_exists = os.path.isdir(quantized_path)
+    if (quantized_exists and (upserted or stale_ids)) or (quantized and not quantized_exists):
+        build_quantized_index(collection, quantized_path, exact_vectors or has_exact_vectors(quantized_path))
+
+    print(f"Unchanged files: {skipped}, upserted chunks: {upserted}, deleted chunks: {len(stale_ids)}")
+    print(f"Number of items in collection: {collection.count()}")
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    arg_parser = argparse.ArgumentParser(description="Chunk, embed and store the Manim docs in Chroma")
+    arg_parser.add_argument("--input", default=JSON_PATH,
+                            help="Parsed docs: manim_docs.json, or manim_docs.jsonl from parse_manim_docs.py --parallel")
+    arg_parser.add_argument("--incremental", action="store_true")
+    arg_parser.add_argument("--quantized", action="store_true")
+    # Keeps a float32 copy next to the int8 codes so searches can re-rank their candidates
+    arg_parser.add_argument("--exact-vectors", action="store_true")
+    args = arg_parser.parse_args()
+    if args.incremental:
+        main_incremental(json_path=args.input, quantized=args.quantized, exact_vectors=args.exact_vectors)
+    else:
+        main(json_path=args.input, quantized=args.quantized, exact_vectors=args.exact_vectors)
\ No newline at end of file
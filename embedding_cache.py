@@ -0,0 +1,236 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process locking, so give each process its own shared cache path
+    fcntl = None
+
+MODEL_NAME = "all-MiniLM-L6-v2"
+INGEST_CACHE_PATH = "./embedding_cache/ingest"
+QUERY_CACHE_PATH = "./embedding_cache/query"
+
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace so trivially different strings share an entry"""
+    return " ".join(text.split())
+
+
+# encode() options that do not change the vectors, left out of the cache key
+IGNORED_ENCODE_KWARGS = {"batch_size", "show_progress_bar", "convert_to_numpy", "convert_to_tensor", "device"}
+
+
+def encode_variant(kwargs: Dict) -> str:
+    """The encode() options that change the vectors (e.g. normalize_embeddings), as part of a cache key"""
+    return json.dumps({k: v for k, v in kwargs.items() if k not in IGNORED_ENCODE_KWARGS},
+                      sort_keys=True, default=str)
+
+
+def cache_key(model_name: str, text: str, variant: str = "{}") -> str:
+    return hashlib.sha256(f"{model_name}\0{variant}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    On-disk embedding cache keyed by (model name, normalized text hash).
+
+    Vectors live in a memory-mapped float32 file (vectors.f32), one row per
+    entry, and index.json maps each key to its row. With max_entries set the
+    cache evicts least recently used entries and reuses their rows; without it
+    the cache only grows.
+
+    A shared cache may be used by several processes at once (the retrieval
+    server, job workers...): every write takes an exclusive file lock,
+    re-reads index.json if another process changed it, allocates rows and
+    writes the index back before releasing the lock, and reads take a shared
+    lock. Recency for eviction is then per process. Unshared caches have a
+    single writer and only persist the index on flush().
+    """
+
+    def __init__(self, path: str, model_name: str = MODEL_NAME, max_entries: Optional[int] = None,
+                 shared: bool = False):
+        self.path = path
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.shared = shared
+        self.vectors_path = os.path.join(path, "vectors.f32")
+        self.index_path = os.path.join(path, "index.json")
+        self.lock_path = os.path.join(path, "lock")
+        self._lock = threading.Lock()
+        self._index_stamp = None
+        os.makedirs(self.path, exist_ok=True)
+        self._load()
+
+    def _reset(self):
+        self._index = OrderedDict()
+        self._free_rows = []
+        self._rows = 0
+        self._capacity = 0
+        self._dim = None
+        self._vectors = None
+
+    def _stamp(self):
+        try:
+            stat = os.stat(self.index_path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    def _load(self):
+        self._reset()
+        self._index_stamp = self._stamp()
+        if self._index_stamp is None or not os.path.isfile(self.vectors_path):
+            return
+        with open(self.index_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("model") != self.model_name:
+            # Vectors from another model are useless here; start over
+            return
+        self._dim = data["dim"]
+        self._rows = data["rows"]
+        self._index = OrderedDict(data["entries"])
+        used = set(self._index.values())
+        self._free_rows = [row for row in range(self._rows) if row not in used]
+        self._capacity = os.path.getsize(self.vectors_path) // (4 * self._dim)
+        self._open_vectors()
+
+    def _refresh(self):
+        """Reloads the index if another process rewrote it"""
+        if self.shared and self._stamp() != self._index_stamp:
+            self._load()
+
+    @contextmanager
+    def _file_lock(self, exclusive: bool):
+        if not self.shared or fcntl is None:
+            yield
+            return
+        with open(self.lock_path, "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _open_vectors(self):
+        self._vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r+",
+                                  shape=(self._capacity, self._dim))
+
+    def _ensure_capacity(self, rows: int):
+        if rows <= self._capacity:
+            return
+        if self._vectors is not None:
+            self._vectors.flush()
+            self._vectors = None
+        self._capacity = max(rows, self._capacity * 2, 1024)
+        with open(self.vectors_path, "ab") as f:
+            f.truncate(self._capacity * self._dim * 4)
+        self._open_vectors()
+
+    def __len__(self):
+        return len(self._index)
+
+    def get_many(self, texts: List[str], variant: str = "{}") -> List[Optional[np.ndarray]]:
+        """Returns a cached vector (a copy) or None for each text"""
+        results = []
+        with self._lock, self._file_lock(exclusive=False):
+            self._refresh()
+            for text in texts:
+                key = cache_key(self.model_name, text, variant)
+                row = self._index.get(key)
+                if row is None:
+                    results.append(None)
+                    continue
+                if self.max_entries is not None:
+                    self._index.move_to_end(key)
+                results.append(np.array(self._vectors[row]))
+        return results
+
+    def put_many(self, texts: List[str], vectors: np.ndarray, variant: str = "{}"):
+        with self._lock, self._file_lock(exclusive=True):
+            self._refresh()
+            if self._dim is None:
+                self._dim = vectors.shape[1]
+            for text, vector in zip(texts, vectors):
+                key = cache_key(self.model_name, text, variant)
+                row = self._index.get(key)
+                if row is None:
+                    if self.max_entries is not None and len(self._index) >= self.max_entries:
+                        _, evicted_row = self._index.popitem(last=False)
+                        self._free_rows.append(evicted_row)
+                    if self._free_rows:
+                        row = self._free_rows.pop()
+                    else:
+                        row = self._rows
+                        self._rows += 1
+                        self._ensure_capacity(self._rows)
+                    self._index[key] = row
+                self._vectors[row] = vector
+            if self.shared:
+                # Publish the new rows before another process can allocate them
+                self._write_index()
+
+    def _write_index(self):
+        self._vectors.flush()
+        tmp_path = f"{self.index_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "model": self.model_name,
+                "dim": self._dim,
+                "rows": self._rows,
+                "entries": list(self._index.items())
+            }, f)
+        os.replace(tmp_path, self.index_path)
+        self._index_stamp = self._stamp()
+
+    def flush(self):
+        """Persists the vectors and the index"""
+        with self._lock, self._file_lock(exclusive=True):
+            if self._vectors is None:
+                return
+            if self.shared:
+                # The index on disk is already current; only the vectors may be pending
+                self._vectors.flush()
+                return
+            self._write_index()
+
+
+class CachedEmbedder:
+    """
+    Wraps a SentenceTransformer so encode() only runs the model on texts the
+    cache has not seen. Always returns a float32 array.
+    """
+
+    def __init__(self, model, cache: EmbeddingCache):
+        self.model = model
+        self.cache = cache
+
+    def encode(self, texts: List[str], **kwargs) -> np.ndarray:
+        variant = encode_variant(kwargs)
+        cached = self.cache.get_many(texts, variant)
+        misses = [i for i, vector in enumerate(cached) if vector is None]
+
+        if misses:
+            kwargs["convert_to_numpy"] = True
+            fresh = np.asarray(self.model.encode([texts[i] for i in misses], **kwargs), dtype=np.float32)
+            self.cache.put_many([texts[i] for i in misses], fresh, variant)
+            for i, vector in zip(misses, fresh):
+                cached[i] = vector
+
+        if not cached:
+            return np.empty((0, self.model.get_sentence_embedding_dimension()), dtype=np.float32)
+        return np.stack(cached).astype(np.float32, copy=False)
+
+
+def load_embedder(cache_path: str = INGEST_CACHE_PATH, max_entries: Optional[int] = None,
+                  shared: bool = False) -> CachedEmbedder:
+    from sentence_transformers import SentenceTransformer
+
+    return CachedEmbedder(SentenceTransformer(MODEL_NAME),
+                          EmbeddingCache(cache_path, MODEL_NAME, max_entries, shared))
@@ -1,92 +1,128 @@
-import chromadb
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI, APIConnectionError, APITimeoutError, InternalServerError, RateLimitError
 from dotenv import load_dotenv
+import asyncio
 import os
+import random
 import re
-from typing import List, Dict
-
-class GenericSceneParser:
-    def __init__(self):
-        # Generic patterns that work for any educational content
-        self.patterns = {
-            'scene_marker': r'(.*?)\s*\((\d+)\s*seconds\):',
-            'text': r'Text:\s*[\'"]([^\'"]+)[\'"]',
-            'animation': r'Animation:\s*([^\.]+)',
-            'duration': r'Duration:\s*([^\.]+)',
-            'transition': r'Transition:\s*([^\.]+)'
-        }
-
-    def parse_script(self, script: str) -> List[Dict]:
-        """Parse any educational script into structured scene data"""
-        # Split into scenes based on time markers
-        scene_splits = re.split(self.patterns['scene_marker'], script)
-        scenes = []
-        
-        # Process each scene
-        for i in range(1, len(scene_splits), 3):
-            if i + 1 >= len(scene_splits):
-                break
-                
-            scene_name = scene_splits[i].strip()
-            duration = int(scene_splits[i + 1])
-            content = scene_splits[i + 2].strip()
-            
-            # Parse scene content
-            scene = {
-                'name': scene_name,
-                'duration': duration,
-                'content': self._parse_content(content),
-                'raw_text': content
-            }
-            scenes.append(scene)
-            
-        return scenes
+import time
+from typing import Callable, List, Dict, Optional
 
-    def _parse_content(self, content: str) -> Dict:
-        """Parse the content of a scene into structured data"""
-        parts = [p.strip() for p in content.split('.') if p.strip()]
-        
-        scene_content = {
-            'texts': [],
-            'animations': [],
-            'transitions': [],
-            'timings': []
-        }
-        
-        for part in parts:
-            # Extract text elements
-            text_match = re.search(self.patterns['text'], part)
-            if text_match:
-                scene_content['texts'].append(text_match.group(1))
-            
-            # Extract animations
-            anim_match = re.search(self.patterns['animation'], part)
-            if anim_match:
-                scene_content['animations'].append(anim_match.group(1))
-            
-            # Extract timing
-            duration_match = re.search(self.patterns['duration'], part)
-            if duration_match:
-                scene_content['timings'].append(duration_match.group(1))
-            
-            # Extract transitions
-            transition_match = re.search(self.patterns['transition'], part)
-            if transition_match:
-                scene_content['transitions'].append(transition_match.group(1))
-        
-        return scene_content
+from retrieval import retrieve_scene_contexts
+from context_builder import build_context, format_context, CONTEXT_TOKEN_BUDGET
+from symbol_index import SymbolIndex, SYMBOL_INDEX_PATH, symbol_documents
+from scene_templates import template_scene_code
+from tracing import get_tracer, record_usage, span, traced
+from retrieval_server import RetrievalClient
+from llm_cache import ResponseCache, load_response_cache
+from code_stream import SceneCodeStream
+from validate_scenes import ValidationPool, validate_scene_code
+from scene_parser import GenericSceneParser, ParsedScene
+
+MODEL = "deepseek-coder"
+SYSTEM_PROMPT = "You are a Manim expert. Generate a complete, runnable Scene class for the specified educational animation. Focus on proper positioning and timing. Output only the code, no explanations."
+MAX_TOKENS = 2048
+TEMPERATURE = 0.7
+RETRYABLE_ERRORS = (APIConnectionError, APITimeoutError, InternalServerError, RateLimitError)
+
+class TokenBucket:
+    """Async token bucket: refills at `rate` tokens per second up to `burst`"""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
 
 class EducationalVideoGenerator:
-    def __init__(self, api_key: str, base_url: str):
+    def __init__(self, api_key: str, base_url: str, retriever=None, n_results: int = 3,
+                 response_cache: Optional[ResponseCache] = None, validate: bool = False,
+                 max_repair_attempts: int = 2, dry_run_validation: bool = True,
+                 context_tokens: Optional[int] = CONTEXT_TOKEN_BUDGET,
+                 symbol_index: Optional[SymbolIndex] = None, candidates: int = 1,
+                 batched_candidates: bool = False, templates: bool = True):
         self.client_llm = OpenAI(api_key=api_key, base_url=base_url)
+        self.api_key = api_key
+        self.base_url = base_url
+        self._async_client_llm = None
+        self._async_loop = None
         self.parser = GenericSceneParser()
+        # Optional Retriever or RetrievalClient used to add docs to each scene prompt
+        self.retriever = retriever
+        self.n_results = n_results
+        # Token budget for the reference docs of each scene prompt (None: no limit)
+        self.context_tokens = context_tokens
+        # Doc examples for Manim names a scene mentions, looked up without an embedding query
+        self.symbol_index = symbol_index
+        # Holds validated code only, or code as generated when validation is off
+        self.response_cache = response_cache
+        # Pre-render validation: failing scenes are regenerated with the errors in the prompt
+        self.validate = validate
+        self.max_repair_attempts = max_repair_attempts
+        self.dry_run_validation = dry_run_validation
+        self._validation_pool = ValidationPool()
+        # Async generation only: request this many completions per scene and keep the first that validates
+        self.candidates = candidates
+        # Ask for all candidates in one request with n=candidates (the backend must support n)
+        self.batched_candidates = batched_candidates
+        # Scenes that fit a fixed shape (titles, subtitles, stacked text) are built from templates, not the LLM
+        self.templates = templates
+
+    @property
+    def candidates(self) -> int:
+        return self._candidates
+
+    @candidates.setter
+    def candidates(self, candidates: int):
+        if candidates < 1:
+            raise ValueError(f"candidates must be at least 1, got {candidates}")
+        self._candidates = candidates
+
+    @traced("retrieve")
+    def retrieve_contexts(self, scenes: List[ParsedScene]) -> List[List[Dict]]:
+        """
+        Fetch reference docs for all scenes with one batched query, put the
+        symbol index's examples for Manim names in each scene first, and pack
+        the result into the token budget. Scenes covered by a template get no
+        docs, since they never reach the LLM.
+        """
+        queried = [i for i, scene in enumerate(scenes) if self.template_code(scene, i, count=False) is None]
+        contexts = [[] for _ in scenes]
+        if self.retriever is not None and queried:
+            bundles = retrieve_scene_contexts(self.retriever, [scenes[i] for i in queried], n_results=self.n_results)
+            for i, bundle in zip(queried, bundles):
+                contexts[i] = bundle['documents']
+        if self.symbol_index is not None:
+            for i in queried:
+                contexts[i] = symbol_documents(self.symbol_index, scenes[i].raw_text, max_symbols=3) + contexts[i]
+        return [build_context(documents, self.context_tokens) for documents in contexts]
 
-    def generate_scene_prompt(self, scene: Dict) -> str:
+    def template_code(self, scene: ParsedScene, index: int, count: bool = True) -> Optional[str]:
+        """The scene's code from a template, or None if it needs the LLM"""
+        if not self.templates:
+            return None
+        scene_code = template_scene_code(scene, index)
+        if scene_code is not None and count:
+            get_tracer().count("template_scenes")
+        return scene_code
+
+    def generate_scene_prompt(self, scene: ParsedScene, documents: Optional[List[Dict]] = None) -> str:
         """Generate a prompt for any educational scene"""
         return f"""
 Generate a complete Manim scene class that implements the following educational scene.
-Scene Name: {scene['name']}
-Duration: {scene['duration']} seconds
+Scene Name: {scene.name}
+Duration: {scene.duration} seconds
 
 Required Elements:
 1. All text elements must be properly positioned and spaced
@@ -96,7 +132,7 @@ Required Elements:
 5. Transitions must be smooth
 
 Scene Details:
-{scene['raw_text']}
+{scene.raw_text}
 
 Scene Requirements:
 - Create a self-contained Scene class that handles all specified animations
@@ -108,72 +144,432 @@ Scene Requirements:
 - Clear any elements that should not persist between animations
 
 Generate only the complete Manim code for this scene, with no explanations or comments.
+""" + self._format_documents(documents)
+
+    def _format_documents(self, documents: Optional[List[Dict]]) -> str:
+        return format_context(documents)
+
+    def _build_messages(self, prompt: str) -> List[Dict]:
+        return [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ]
+
+    def _cached_response(self, scene: ParsedScene, prompt: str) -> Optional[str]:
+        if self.response_cache is None:
+            return None
+        return self.response_cache.get(MODEL, SYSTEM_PROMPT, prompt, TEMPERATURE, MAX_TOKENS,
+                                       semantic_text=scene.raw_text)
+
+    def _store_response(self, scene: ParsedScene, prompt: str, content: str):
+        if self.response_cache is not None:
+            self.response_cache.put(MODEL, SYSTEM_PROMPT, prompt, TEMPERATURE, MAX_TOKENS, content,
+                                    semantic_text=scene.raw_text)
+
+    def _drop_response(self, scene: ParsedScene, prompt: str):
+        if self.response_cache is not None:
+            self.response_cache.delete(MODEL, SYSTEM_PROMPT, prompt, TEMPERATURE, MAX_TOKENS,
+                                       semantic_text=scene.raw_text)
+
+    def repair_prompt(self, prompt: str, scene_code: str, errors: List[str]) -> str:
+        """Prompt asking the model to fix a scene that failed validation"""
+        error_list = "\n".join(f"- {error}" for error in errors)
+        if self.symbol_index is not None:
+            # Working doc examples for the Manim names the errors point at
+            examples = symbol_documents(self.symbol_index, " ".join(errors), max_symbols=2)
+            error_list += format_context(build_context(examples, self.context_tokens))
+        return f"""{prompt}
+The previous attempt below failed validation before rendering.
+
+Previous Code:
+{scene_code}
+
+Errors:
+{error_list}
+
+Fix these errors and generate the complete corrected Manim code for this scene, with no explanations or comments.
 """
 
-    def generate_code(self, script: str) -> str:
-        # Parse script into structured scenes
-        scenes = self.parser.parse_script(script)
-        
-        # Generate code for each scene
-        all_scenes_code = []
-        for i, scene in enumerate(scenes):
-            prompt = self.generate_scene_prompt(scene)
-            
+    def validate_scene(self, scene_code: str) -> List[str]:
+        """Static checks plus a dry construct() pass on a worker process"""
+        return validate_scene_code(scene_code, dry_run=self.dry_run_validation, pool=self._validation_pool)
+
+    def close(self):
+        """Shuts down the validation worker processes"""
+        self._validation_pool.shutdown()
+
+    async def aclose(self):
+        """Closes the AsyncOpenAI client, from the event loop that made its requests"""
+        if self._async_client_llm is not None:
+            await self._async_client_llm.close()
+            self._async_client_llm = None
+
+    def _complete(self, prompt: str) -> str:
+        with span("llm", model=MODEL, mode="sync"):
             response = self.client_llm.chat.completions.create(
-                model="deepseek-coder",
-                messages=[
-                    {
-                        "role": "system", 
-                        "content": "You are a Manim expert. Generate a complete, runnable Scene class for the specified educational animation. Focus on proper positioning and timing. Output only the code, no explanations."
-                    },
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=2048,
-                temperature=0.7,
+                model=MODEL,
+                messages=self._build_messages(prompt),
+                max_tokens=MAX_TOKENS,
+                temperature=TEMPERATURE,
                 stream=False
             )
-            
-            scene_code = response.choices[0].message.content.strip()
-            # Clean up the code if it contains markdown markers
-            scene_code = re.sub(r'^```python\s*', '', scene_code)
-            scene_code = re.sub(r'\s*```$', '', scene_code)
-            
-            # Ensure unique scene names
-            scene_code = re.sub(
-                r'class\s+Scene\s*\(Scene\)',
-                f'class Scene{i}(Scene)',
-                scene_code
-            )
-            
-            all_scenes_code.append(scene_code)
+            record_usage(response.usage, model=MODEL)
+        return response.choices[0].message.content
+
+    def repair_scene(self, scene: ParsedScene, prompt: str, content: str, index: int,
+                     errors: Optional[List[str]] = None) -> str:
+        """
+        Validates a scene and regenerates it until it passes or attempts run
+        out. Code that passes is cached under the original prompt; if none
+        does, any cached response for the prompt is dropped. errors, when
+        already known (e.g. from candidate checks), replace the first
+        validation; [] means the code already passed.
+        """
+        scene_code = self.clean_scene_code(content, index)
+        if errors == []:
+            return scene_code
+        for attempt in range(self.max_repair_attempts + 1):
+            if errors is None:
+                errors = self.validate_scene(scene_code)
+            if not errors:
+                self._store_response(scene, prompt, content)
+                break
+            print(f"Scene {index} failed validation: {errors}")
+            if attempt == self.max_repair_attempts:
+                self._drop_response(scene, prompt)
+                break
+            content = self._complete(self.repair_prompt(prompt, scene_code, errors))
+            scene_code = self.clean_scene_code(content, index)
+            errors = None
+        return scene_code
+
+    def clean_scene_code(self, content: str, index: int) -> str:
+        scene_code = content.strip()
+        # Clean up the code if it contains markdown markers
+        scene_code = re.sub(r'^```python\s*', '', scene_code)
+        scene_code = re.sub(r'\s*```$', '', scene_code)
         
+        # Ensure unique scene names (cached code may carry another scene's index)
+        scene_code = re.sub(
+            r'class\s+Scene\d*\s*\(Scene\)',
+            f'class Scene{index}(Scene)',
+            scene_code
+        )
+        return scene_code
+
+    def assemble_code(self, all_scenes_code: List[str]) -> str:
         # Combine all scenes
-        final_code = """from manim import *
+        return """from manim import *
 
 {scenes}
 
 if __name__ == "__main__":
-    scenes_to_render = [{scene_list}]
-    for scene in scenes_to_render:
-        scene().render()
+    try:
+        from render_scenes import render_module
+    except ImportError:
+        for scene in [{scene_list}]:
+            scene().render()
+    else:
+        # Scenes share no state, so render them on a process pool
+        render_module(__file__, [{scene_names}])
 """.format(
             scenes="\n\n".join(all_scenes_code),
-            scene_list=", ".join([f"Scene{i}" for i in range(len(scenes))])
+            scene_list=", ".join([f"Scene{i}" for i in range(len(all_scenes_code))]),
+            scene_names=", ".join([f'"Scene{i}"' for i in range(len(all_scenes_code))])
         )
+
+    @traced("video")
+    def generate_code(self, script: str) -> str:
+        # Parse script into structured scenes
+        scenes = self.parser.parse_script(script)
+        contexts = self.retrieve_contexts(scenes)
+        
+        # Generate code for each scene
+        all_scenes_code = []
+        for i, scene in enumerate(scenes):
+            scene_code = self.template_code(scene, i)
+            if scene_code is not None:
+                all_scenes_code.append(scene_code)
+                continue
+            prompt = self.generate_scene_prompt(scene, contexts[i])
+            
+            content = self._cached_response(scene, prompt)
+            cached = content is not None
+            if not cached:
+                content = self._complete(prompt)
+            
+            if self.validate:
+                all_scenes_code.append(self.repair_scene(scene, prompt, content, i))
+            else:
+                if not cached:
+                    self._store_response(scene, prompt, content)
+                all_scenes_code.append(self.clean_scene_code(content, i))
         
-        return final_code
+        return self.assemble_code(all_scenes_code)
+
+    def _stream_completion(self, prompt: str):
+        """Yields content deltas of a streamed chat completion"""
+        started = time.perf_counter()
+        stream = self.client_llm.chat.completions.create(
+            model=MODEL,
+            messages=self._build_messages(prompt),
+            max_tokens=MAX_TOKENS,
+            temperature=TEMPERATURE,
+            stream=True
+        )
+        for chunk in stream:
+            # Usage only arrives on streams whose provider reports it
+            record_usage(getattr(chunk, "usage", None), model=MODEL)
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+        # A span cannot stay open across yields to the consumer, so the stream is recorded once drained
+        get_tracer().record("llm", time.perf_counter() - started, model=MODEL, mode="stream")
+
+    @traced("video")
+    def generate_code_streaming(self, script: str,
+                                on_scene_class: Optional[Callable[[int, str], None]] = None) -> str:
+        """
+        Like generate_code, but consumes each completion as it streams in.
+        Every scene class is passed to on_scene_class(scene_index, source) as
+        soon as its code closes, before the rest of the response arrives.
+        With validation on, each scene then goes through repair_scene; if the
+        repaired code differs, it is passed to on_scene_class again.
+        """
+        scenes = self.parser.parse_script(script)
+        contexts = self.retrieve_contexts(scenes)
+
+        all_scenes_code = []
+        for i, scene in enumerate(scenes):
+            scene_code = self.template_code(scene, i)
+            if scene_code is not None:
+                if on_scene_class:
+                    on_scene_class(i, scene_code)
+                all_scenes_code.append(scene_code)
+                continue
+            prompt = self.generate_scene_prompt(scene, contexts[i])
+            code_stream = SceneCodeStream(
+                i, (lambda source, i=i: on_scene_class(i, source)) if on_scene_class else None
+            )
+
+            content = self._cached_response(scene, prompt)
+            cached = content is not None
+            if cached:
+                code_stream.feed(content)
+            else:
+                deltas = []
+                for delta in self._stream_completion(prompt):
+                    deltas.append(delta)
+                    code_stream.feed(delta)
+                content = "".join(deltas)
+            scene_code = code_stream.close()
+
+            if self.validate:
+                # Caches the code only if it passes, and drops a cached entry that no longer does
+                repaired = self.repair_scene(scene, prompt, scene_code, i)
+                if repaired != scene_code and on_scene_class:
+                    on_scene_class(i, repaired)
+                scene_code = repaired
+            elif not cached:
+                self._store_response(scene, prompt, content)
+            all_scenes_code.append(scene_code)
+
+        return self.assemble_code(all_scenes_code)
+
+    @property
+    def async_client_llm(self) -> AsyncOpenAI:
+        """AsyncOpenAI client shared by all requests made on the current event loop"""
+        loop = asyncio.get_running_loop()
+        if self._async_client_llm is None or self._async_loop is not loop:
+            # Retries are handled by _complete_async so the client does not double them
+            self._async_client_llm = AsyncOpenAI(api_key=self.api_key, base_url=self.base_url, max_retries=0)
+            self._async_loop = loop
+        return self._async_client_llm
+
+    async def _complete_async(self, prompt: str, semaphore: asyncio.Semaphore,
+                              bucket: Optional[TokenBucket], max_retries: int, n: Optional[int] = None):
+        """
+        One chat completion with concurrency limiting, rate limiting and
+        retries. With n, asks for n choices and returns all their contents.
+        """
+        for attempt in range(max_retries + 1):
+            # The slot is held for the request only; backoff sleeps leave it to other scenes
+            async with semaphore:
+                if bucket is not None:
+                    await bucket.acquire()
+                try:
+                    with span("llm", model=MODEL, mode="async", attempt=attempt):
+                        response = await self.async_client_llm.chat.completions.create(
+                            model=MODEL,
+                            messages=self._build_messages(prompt),
+                            max_tokens=MAX_TOKENS,
+                            temperature=TEMPERATURE,
+                            stream=False,
+                            **({"n": n} if n else {})
+                        )
+                        record_usage(response.usage, model=MODEL)
+                except RETRYABLE_ERRORS:
+                    if attempt == max_retries:
+                        raise
+                else:
+                    if n:
+                        return [choice.message.content for choice in response.choices]
+                    return response.choices[0].message.content
+            # Exponential backoff with jitter so retries do not stampede
+            await asyncio.sleep(min(30.0, 2 ** attempt) * (0.5 + random.random() / 2))
+
+    async def _first_valid_candidate(self, prompt: str, index: int, semaphore: asyncio.Semaphore,
+                                     bucket: Optional[TokenBucket], max_retries: int):
+        """
+        Requests self.candidates completions of a prompt at once and
+        validates each as soon as it arrives. The first candidate that passes
+        wins and the requests still in flight are cancelled (validations
+        already running on the pool finish in the background). Returns
+        (content, errors); if no candidate passes, the first one checked is
+        returned with its errors.
+        """
+        if self.batched_candidates:
+            requests = {asyncio.ensure_future(
+                self._complete_async(prompt, semaphore, bucket, max_retries, n=self.candidates)
+            )}
+        else:
+            requests = {asyncio.ensure_future(self._complete_async(prompt, semaphore, bucket, max_retries))
+                        for _ in range(self.candidates)}
+
+        async def check(content: str):
+            return content, await asyncio.to_thread(self.validate_scene, self.clean_scene_code(content, index))
+
+        pending = set(requests)
+        first = None
+        request_error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task in requests:
+                        if task.exception() is not None:
+                            request_error = request_error or task.exception()
+                            continue
+                        contents = task.result()
+                        for content in [contents] if isinstance(contents, str) else contents:
+                            pending.add(asyncio.ensure_future(check(content)))
+                        continue
+                    content, errors = task.result()
+                    if not errors:
+                        return content, errors
+                    first = first or (content, errors)
+        finally:
+            cancelled = sum(1 for task in pending if task in requests and task.cancel())
+            get_tracer().count("llm_cancelled", cancelled, model=MODEL)
+        if first is None:
+            raise request_error or RuntimeError("The completion returned no candidates")
+        return first
+
+    async def _complete_scene_async(self, prompt: str, index: int, semaphore: asyncio.Semaphore,
+                                    bucket: Optional[TokenBucket], max_retries: int):
+        """(content, validation errors or None when not validated yet)"""
+        if self.candidates > 1:
+            return await self._first_valid_candidate(prompt, index, semaphore, bucket, max_retries)
+        return await self._complete_async(prompt, semaphore, bucket, max_retries), None
+
+    async def draft_scene_async(self, scene: ParsedScene, index: int, prompt: str, semaphore: asyncio.Semaphore,
+                                bucket: Optional[TokenBucket], max_retries: int):
+        """
+        (content, errors) for a scene before any repair: its template, cached
+        response or a fresh completion. errors is [] for templates and
+        candidates that passed, the failing candidate's errors, or None when
+        nothing was checked. Fresh content is cached only if it passed, or if
+        it was not checked and validation is off.
+        """
+        scene_code = self.template_code(scene, index)
+        if scene_code is not None:
+            return scene_code, []
+        # Cache lookups may run the embedder, so keep them off the event loop
+        content = await asyncio.to_thread(self._cached_response, scene, prompt)
+        if content is not None:
+            return content, None
+        content, errors = await self._complete_scene_async(prompt, index, semaphore, bucket, max_retries)
+        if errors == [] or (errors is None and not self.validate):
+            await asyncio.to_thread(self._store_response, scene, prompt, content)
+        return content, errors
+
+    async def generate_scene_async(self, scene: ParsedScene, index: int, prompt: str, semaphore: asyncio.Semaphore,
+                                    bucket: Optional[TokenBucket], max_retries: int) -> str:
+        """
+        One scene's code, validated and repaired when self.validate is set.
+        A candidate already known to fail is repaired either way.
+        """
+        content, errors = await self.draft_scene_async(scene, index, prompt, semaphore, bucket, max_retries)
+        scene_code = self.clean_scene_code(content, index)
+        if errors == [] or (errors is None and not self.validate):
+            return scene_code
+
+        # Each scene is validated as soon as it arrives, while others are still generating
+        for attempt in range(self.max_repair_attempts + 1):
+            if errors is None:
+                errors = await asyncio.to_thread(self.validate_scene, scene_code)
+            if not errors:
+                await asyncio.to_thread(self._store_response, scene, prompt, content)
+                break
+            print(f"Scene {index} failed validation: {errors}")
+            if attempt == self.max_repair_attempts:
+                await asyncio.to_thread(self._drop_response, scene, prompt)
+                break
+            content, errors = await self._complete_scene_async(self.repair_prompt(prompt, scene_code, errors),
+                                                               index, semaphore, bucket, max_retries)
+            scene_code = self.clean_scene_code(content, index)
+        return scene_code
+
+    @traced("video")
+    async def generate_code_async(self, script: str, max_concurrency: int = 4,
+                                  requests_per_second: Optional[float] = None,
+                                  max_retries: int = 3) -> str:
+        """
+        Generate all scenes concurrently through the shared AsyncOpenAI client.
+        At most max_concurrency requests are in flight, requests_per_second
+        (if given) caps the request rate, and results are reassembled in
+        scene order so the output matches generate_code. With candidates > 1
+        each scene races several completions and keeps the first valid one.
+        """
+        scenes = self.parser.parse_script(script)
+        contexts = await asyncio.to_thread(self.retrieve_contexts, scenes)
+
+        semaphore = asyncio.Semaphore(max_concurrency)
+        bucket = TokenBucket(requests_per_second, burst=max_concurrency) if requests_per_second else None
+        all_scenes_code = await asyncio.gather(*[
+            self.generate_scene_async(scene, i, self.generate_scene_prompt(scene, contexts[i]),
+                                       semaphore, bucket, max_retries)
+            for i, scene in enumerate(scenes)
+        ])
+
+        return self.assemble_code(list(all_scenes_code))
 
 # Usage
 if __name__ == "__main__":
     load_dotenv()
     api_key = os.getenv('API_KEY')
     
+    # Per-scene doc retrieval goes through a running retrieval_server.py when RETRIEVAL_URL is set
+    retrieval_url = os.getenv('RETRIEVAL_URL')
+    
     generator = EducationalVideoGenerator(
         api_key=api_key,
-        base_url="https://api.deepseek.com"
+        base_url="https://api.deepseek.com",
+        retriever=RetrievalClient(retrieval_url) if retrieval_url else None,
+        symbol_index=SymbolIndex.load() if os.path.isfile(SYMBOL_INDEX_PATH) else None,
+        response_cache=load_response_cache(),
+        validate=bool(os.getenv('VALIDATE_SCENES')),
+        candidates=int(os.getenv('SCENE_CANDIDATES', '1')),
+        templates=not os.getenv('DISABLE_SCENE_TEMPLATES')
     )
     
     script = "Introduction Scene (5 seconds): Text: 'Welcome to Binary Search' (large font, center screen). Animation: Text appears with a Write effect. Subtitle: 'A powerful algorithm for searching sorted arrays' (smaller font, below main text). Animation: Subtitle fades in below the title. Duration: 2 seconds for the animations, 3 seconds of pause. Transition: Both texts fade out simultaneously. What is Binary Search? (10 seconds): Title: 'What is Binary Search?' (large font, center screen). Animation: Title appears with a Write effect, stays on screen for 2 seconds, then fades out. Example Array: '[3, 7, 10, 15, 19, 23, 27]' (displayed horizontally on the screen). Animation: Array values are written out one by one in sequence. Duration: 2 seconds. First Pass: Highlight the entire array. Show 'low' pointer at index 0 with a downward arrow, 'high' pointer at index 6 with a downward arrow, and calculate 'mid' at index 3. Animation: Highlight the value at index 3 (15) in a different color. Display the text: 'Value at mid = 15'. Animation: Fade out the left half ([3, 7, 10]) to indicate it is eliminated. Move the 'low' pointer to index 4. Duration: 3 seconds. Second Pass: Highlight the new array ([19, 23, 27]). Show 'low' pointer at index 4 and 'high' pointer at index 6. Calculate 'mid' at index 5. Animation: Highlight the value at index 5 (23) in a different color. Display the text: 'Value at mid = 23'. Animation: Fade out the right half ([23, 27]) to indicate it is eliminated. Move the 'high' pointer to index 4. Duration: 3 seconds. Third Pass: Highlight the final value ([19]). Show both 'low' and 'high' pointers at index 4. Calculate 'mid' at index 4. Animation: Highlight the value at index 4 (19) in a different color. Display the text: 'Value at mid = 19. Target found!'. Duration: 2 seconds. Code Walkthrough (15 seconds): Title: 'Python Code Implementation' (large font, center screen). Animation: Title appears with a Write effect, stays on screen for 2 seconds, then fades out. Code: Display Python code for binary search line by line, as if being typed out. Animation: Highlight key sections (e.g., while loop, if conditions, and return statements) as they are explained. Duration: 10 seconds for the code walkthrough, including pauses for highlights. Fade out code at the end. Time and Space Complexity (15 seconds): Title: 'Complexity Analysis' (large font, center screen). Animation: Title appears with a Write effect, stays on screen for 2 seconds, then fades out. Display: 'Time Complexity: O(log n)' and 'Space Complexity: O(1)' (stacked vertically, center screen). Animation: Each line appears with a FadeIn effect. Duration: 3 seconds for the animation, 12 seconds of pause for explanation. Fade out both lines at the end. Conclusion Scene (10 seconds): Text: 'Binary Search is simple yet elegant.' (large font, center screen). Animation: Text appears with a Write effect. Subtitle: 'Use it to save time and resources!' (smaller font, below main text). Animation: Subtitle fades in below the title. Duration: 3 seconds for the animations, 7 seconds of pause. Transition: Both texts fade out simultaneously."
 
-    manim_code = generator.generate_code(script)
+    if os.getenv('CONCURRENT_GENERATION') or generator.candidates > 1:
+        manim_code = asyncio.run(generator.generate_code_async(script))
+    elif os.getenv('STREAMING_GENERATION'):
+        manim_code = generator.generate_code_streaming(
+            script, on_scene_class=lambda i, source: print(f"Scene {i}: {source.splitlines()[0]} ready")
+        )
+    else:
+        manim_code = generator.generate_code(script)
     print(manim_code)
\ No newline at end of file
@@ -0,0 +1,597 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from multiprocessing import Process
+from typing import Dict, List, Optional
+
+from tracing import span
+
+JOB_DB_PATH = "./jobs.sqlite3"
+JOB_DIR = "./jobs"
+STAGES = ("retrieve", "generate", "validate", "render")
+DEFAULT_POOL_SIZES = {"retrieve": 1, "generate": 4, "validate": 2, "render": 1}
+# A running task whose worker stops renewing its lease for this long is handed to another worker
+LEASE_SECONDS = 60.0
+MAX_BACKOFF_SECONDS = 300.0
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, timeout=30.0, isolation_level=None, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+class JobQueue:
+    """
+    Persistent queue of text-to-video jobs in SQLite.
+
+    Each job is a script that moves through the stages retrieve -> generate
+    -> validate -> render. Every stage is a task row claimed by one worker
+    at a time under a lease; a finished task enqueues the next stage. Failed
+    tasks are retried with exponential backoff up to max_attempts, and
+    workers that die mid-task lose their lease, so the task is retried
+    elsewhere. Stage outputs are files in the job's directory that a rerun
+    simply overwrites, so retries are idempotent.
+    """
+
+    def __init__(self, path: str = JOB_DB_PATH, job_dir: str = JOB_DIR):
+        self.path = path
+        self.job_dir = job_dir
+        self._lock = threading.Lock()
+        self._conn = _connect(path)
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, idempotency_key TEXT UNIQUE, script TEXT, options TEXT, "
+            "priority INTEGER, status TEXT, stage TEXT, result TEXT, error TEXT, "
+            "created_at REAL, updated_at REAL);"
+            "CREATE TABLE IF NOT EXISTS tasks ("
+            "job_id TEXT, stage TEXT, status TEXT, attempts INTEGER DEFAULT 0, max_attempts INTEGER, "
+            "available_at REAL, lease_until REAL, worker TEXT, output TEXT, error TEXT, "
+            "started_at REAL, finished_at REAL, PRIMARY KEY (job_id, stage));"
+            "CREATE INDEX IF NOT EXISTS tasks_claim ON tasks (stage, status, available_at);"
+        )
+
+    def close(self):
+        self._conn.close()
+
+    def job_path(self, job_id: str, name: str = "") -> str:
+        return os.path.join(self.job_dir, job_id, name)
+
+    def submit(self, script: str, priority: int = 0, options: Optional[Dict] = None, max_attempts: int = 3,
+               idempotency_key: Optional[str] = None) -> str:
+        """
+        Queues a script and returns its job id. Submitting the same script
+        with the same options again (or the same idempotency_key) returns
+        the existing job instead of creating a duplicate; if that job failed,
+        it is requeued from the stage that failed.
+        """
+        options = options or {}
+        key = idempotency_key or hashlib.sha256(
+            json.dumps([script, options], sort_keys=True).encode("utf-8")
+        ).hexdigest()
+        job_id = uuid.uuid4().hex[:12]
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                existing = self._conn.execute(
+                    "SELECT id, status FROM jobs WHERE idempotency_key = ?", (key,)
+                ).fetchone()
+                if existing:
+                    if existing["status"] == "failed":
+                        self._requeue(existing["id"], now)
+                    self._conn.execute("COMMIT")
+                    return existing["id"]
+                self._conn.execute(
+                    "INSERT INTO jobs (id, idempotency_key, script, options, priority, status, stage, "
+                    "created_at, updated_at) VALUES (?, ?, ?, ?, ?, 'queued', ?, ?, ?)",
+                    (job_id, key, script, json.dumps(options), priority, STAGES[0], now, now)
+                )
+                self._conn.execute(
+                    "INSERT INTO tasks (job_id, stage, status, max_attempts, available_at) "
+                    "VALUES (?, ?, 'pending', ?, ?)", (job_id, STAGES[0], max_attempts, now)
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        os.makedirs(self.job_path(job_id), exist_ok=True)
+        return job_id
+
+    def _requeue(self, job_id: str, now: float):
+        """Resets a failed job's failed task to a fresh set of attempts; call inside a transaction"""
+        self._conn.execute(
+            "UPDATE tasks SET status = 'pending', attempts = 0, available_at = ?, worker = NULL, error = NULL, "
+            "finished_at = NULL WHERE job_id = ? AND status = 'failed'", (now, job_id)
+        )
+        self._conn.execute(
+            "UPDATE jobs SET status = 'queued', error = NULL, updated_at = ? WHERE id = ?", (now, job_id)
+        )
+
+    def retry(self, job_id: str) -> bool:
+        """Requeues a failed job from the stage that failed; False if the job is not failed"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                job = self._conn.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+                failed = job is not None and job["status"] == "failed"
+                if failed:
+                    self._requeue(job_id, now)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return failed
+
+    def claim(self, stage: str, worker: str, lease: float = LEASE_SECONDS) -> Optional[Dict]:
+        """
+        Leases the highest-priority, oldest runnable task of a stage, or
+        returns None. Tasks whose lease expired (their worker died) are
+        re-leased while they have attempts left and failed otherwise, so a
+        task that keeps killing its worker cannot loop forever.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                exhausted = self._conn.execute(
+                    "SELECT job_id, attempts FROM tasks WHERE stage = ? AND status = 'running' AND lease_until < ? "
+                    "AND attempts >= max_attempts", (stage, now)
+                ).fetchall()
+                for expired in exhausted:
+                    error = f"worker lost its lease on attempt {expired['attempts']}"
+                    self._conn.execute(
+                        "UPDATE tasks SET status = 'failed', error = ?, finished_at = ? WHERE job_id = ? AND stage = ?",
+                        (error, now, expired["job_id"], stage)
+                    )
+                    self._conn.execute(
+                        "UPDATE jobs SET status = 'failed', error = ?, updated_at = ? WHERE id = ?",
+                        (f"{stage}: {error}", now, expired["job_id"])
+                    )
+                row = self._conn.execute(
+                    "SELECT t.job_id, t.attempts, j.script, j.options, j.priority FROM tasks t "
+                    "JOIN jobs j ON j.id = t.job_id WHERE t.stage = ? AND ("
+                    "(t.status = 'pending' AND t.available_at <= ?) "
+                    "OR (t.status = 'running' AND t.lease_until < ? AND t.attempts < t.max_attempts)"
+                    ") ORDER BY j.priority DESC, j.created_at LIMIT 1", (stage, now, now)
+                ).fetchone()
+                if row is None:
+                    self._conn.execute("COMMIT")
+                    return None
+                self._conn.execute(
+                    "UPDATE tasks SET status = 'running', attempts = attempts + 1, lease_until = ?, worker = ?, "
+                    "started_at = ? WHERE job_id = ? AND stage = ?", (now + lease, worker, now, row["job_id"], stage)
+                )
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'running', stage = ?, updated_at = ? WHERE id = ?",
+                    (stage, now, row["job_id"])
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return {"job_id": row["job_id"], "stage": stage, "attempt": row["attempts"] + 1, "script": row["script"],
+                "options": json.loads(row["options"]), "priority": row["priority"]}
+
+    def renew(self, job_id: str, stage: str, worker: str, lease: float = LEASE_SECONDS) -> bool:
+        """Extends a running task's lease; False if another worker has taken it over"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE tasks SET lease_until = ? WHERE job_id = ? AND stage = ? AND worker = ? AND status = 'running'",
+                (time.time() + lease, job_id, stage, worker)
+            )
+        return cursor.rowcount == 1
+
+    def complete(self, job_id: str, stage: str, worker: str, output: str) -> bool:
+        """
+        Marks a task done and enqueues the job's next stage (or finishes the
+        job). Only the worker holding the lease can complete it, so a worker
+        that lost its lease cannot advance the job twice.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                cursor = self._conn.execute(
+                    "UPDATE tasks SET status = 'done', output = ?, error = NULL, finished_at = ? "
+                    "WHERE job_id = ? AND stage = ? AND worker = ? AND status = 'running'",
+                    (output, now, job_id, stage, worker)
+                )
+                if cursor.rowcount != 1:
+                    self._conn.execute("COMMIT")
+                    return False
+                next_index = STAGES.index(stage) + 1
+                if next_index < len(STAGES):
+                    max_attempts = self._conn.execute(
+                        "SELECT max_attempts FROM tasks WHERE job_id = ? AND stage = ?", (job_id, stage)
+                    ).fetchone()["max_attempts"]
+                    self._conn.execute(
+                        "INSERT OR IGNORE INTO tasks (job_id, stage, status, max_attempts, available_at) "
+                        "VALUES (?, ?, 'pending', ?, ?)", (job_id, STAGES[next_index], max_attempts, now)
+                    )
+                    self._conn.execute(
+                        "UPDATE jobs SET status = 'queued', stage = ?, updated_at = ? WHERE id = ?",
+                        (STAGES[next_index], now, job_id)
+                    )
+                else:
+                    self._conn.execute(
+                        "UPDATE jobs SET status = 'done', result = ?, updated_at = ? WHERE id = ?",
+                        (output, now, job_id)
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return True
+
+    def fail(self, job_id: str, stage: str, worker: str, error: str) -> bool:
+        """
+        Schedules a retry with exponential backoff. Returns False once
+        attempts run out and the job fails, or if this worker no longer
+        holds the task (nothing is retried on its behalf then).
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT attempts, max_attempts FROM tasks WHERE job_id = ? AND stage = ? AND worker = ? "
+                    "AND status = 'running'", (job_id, stage, worker)
+                ).fetchone()
+                if row is None:
+                    self._conn.execute("COMMIT")
+                    return False
+                retry = row["attempts"] < row["max_attempts"]
+                if retry:
+                    delay = min(MAX_BACKOFF_SECONDS, 2.0 ** row["attempts"])
+                    self._conn.execute(
+                        "UPDATE tasks SET status = 'pending', available_at = ?, error = ?, worker = NULL "
+                        "WHERE job_id = ? AND stage = ?", (now + delay, error, job_id, stage)
+                    )
+                    self._conn.execute("UPDATE jobs SET status = 'queued', updated_at = ? WHERE id = ?", (now, job_id))
+                else:
+                    self._conn.execute(
+                        "UPDATE tasks SET status = 'failed', error = ?, finished_at = ? WHERE job_id = ? AND stage = ?",
+                        (error, now, job_id, stage)
+                    )
+                    self._conn.execute(
+                        "UPDATE jobs SET status = 'failed', error = ?, updated_at = ? WHERE id = ?",
+                        (f"{stage}: {error}", now, job_id)
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return retry
+
+    def status(self, job_id: str) -> Optional[Dict]:
+        """
+        Job state with per-stage progress: {"id", "status", "stage",
+        "progress", "stages", "result", "error", "preview"}
+        """
+        with self._lock:
+            job = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if job is None:
+                return None
+            tasks = {
+                row["stage"]: row for row in
+                self._conn.execute("SELECT * FROM tasks WHERE job_id = ?", (job_id,)).fetchall()
+            }
+        stages = {}
+        for stage in STAGES:
+            task = tasks.get(stage)
+            stages[stage] = {"status": "waiting"} if task is None else {
+                "status": task["status"], "attempts": task["attempts"], "error": task["error"],
+                "seconds": (task["finished_at"] - task["started_at"])
+                if task["finished_at"] and task["started_at"] else None
+            }
+        done = sum(1 for stage in stages.values() if stage["status"] == "done")
+        preview_path = self.job_path(job_id, "preview.mp4")
+        return {"id": job["id"], "status": job["status"], "stage": job["stage"], "priority": job["priority"],
+                "progress": done / len(STAGES), "stages": stages, "result": job["result"], "error": job["error"],
+                "preview": preview_path if os.path.isfile(preview_path) else None}
+
+    def list_jobs(self, status: Optional[str] = None, limit: int = 50) -> List[Dict]:
+        query = "SELECT id FROM jobs" + (" WHERE status = ?" if status else "") + " ORDER BY created_at DESC LIMIT ?"
+        with self._lock:
+            ids = [row["id"] for row in self._conn.execute(query, ((status, limit) if status else (limit,)))]
+        return [self.status(job_id) for job_id in ids]
+
+    def pending(self) -> int:
+        """Jobs that are queued or running"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status IN ('queued', 'running')"
+            ).fetchone()[0]
+
+
+# Per-process stage resources, created on first use so each worker loads them once
+_generator = None
+_retriever = None
+
+
+def get_generator():
+    """The stage's generator, without a retriever: only the retrieve stage queries docs"""
+    global _generator
+    if _generator is None:
+        from enhanced_RAG import EducationalVideoGenerator
+        from llm_cache import load_response_cache
+        from symbol_index import SymbolIndex, SYMBOL_INDEX_PATH
+
+        _generator = EducationalVideoGenerator(
+            api_key=os.getenv("API_KEY"),
+            base_url=os.getenv("LLM_BASE_URL", "https://api.deepseek.com"),
+            response_cache=load_response_cache(),
+            # The validate stage checks and repairs every scene and caches only what passes
+            validate=True,
+            symbol_index=SymbolIndex.load() if os.path.isfile(SYMBOL_INDEX_PATH) else None
+        )
+    return _generator
+
+
+def get_retriever():
+    """
+    A RetrievalClient when RETRIEVAL_URL is set, otherwise a local Retriever
+    (embedding model plus Chroma client), loaded by the retrieve worker only
+    """
+    global _retriever
+    if _retriever is None:
+        retrieval_url = os.getenv("RETRIEVAL_URL")
+        if retrieval_url:
+            from retrieval_server import RetrievalClient
+            _retriever = RetrievalClient(retrieval_url)
+        elif os.path.isdir("./chroma_db"):
+            from retrieval import Retriever
+            # QUANTIZED_INDEX_PATH points at an int8 index to search instead of Chroma's HNSW
+            _retriever = Retriever(quantized_path=os.getenv("QUANTIZED_INDEX_PATH"))
+    return _retriever
+
+
+def _read_json(path: str):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _write_json(path: str, data):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def run_retrieve(queue: JobQueue, task: Dict) -> str:
+    generator = get_generator()
+    generator.retriever = get_retriever()
+    scenes = generator.parser.parse_script(task["script"])
+    if not scenes:
+        raise ValueError("Script has no scenes")
+    path = queue.job_path(task["job_id"], "contexts.json")
+    _write_json(path, generator.retrieve_contexts(scenes))
+    return path
+
+
+def run_generate(queue: JobQueue, task: Dict) -> str:
+    from enhanced_RAG import TokenBucket
+
+    generator = get_generator()
+    scenes = generator.parser.parse_script(task["script"])
+    contexts = _read_json(queue.job_path(task["job_id"], "contexts.json"))
+    prompts = [generator.generate_scene_prompt(scene, documents) for scene, documents in zip(scenes, contexts)]
+    options = task["options"]
+
+    async def generate_all():
+        semaphore = asyncio.Semaphore(options.get("max_concurrency", 4))
+        rate = options.get("requests_per_second")
+        bucket = TokenBucket(rate, burst=options.get("max_concurrency", 4)) if rate else None
+        # Validation is its own stage, but with several candidates per scene
+        # each candidate is checked and the first valid one kept
+        generator.candidates = options.get("candidates", 1)
+        return await asyncio.gather(*[
+            generator.draft_scene_async(scene, i, prompt, semaphore, bucket, options.get("max_retries", 3))
+            for i, (scene, prompt) in enumerate(zip(scenes, prompts))
+        ])
+
+    drafts = asyncio.run(generate_all())
+    path = queue.job_path(task["job_id"], "scenes.json")
+    # A failing candidate's errors go to the validate stage, which repairs from them
+    _write_json(path, [
+        {"prompt": prompt, "code": generator.clean_scene_code(content, i), "errors": errors}
+        for i, (prompt, (content, errors)) in enumerate(zip(prompts, drafts))
+    ])
+    return path
+
+
+def run_validate(queue: JobQueue, task: Dict) -> str:
+    generator = get_generator()
+    scenes = generator.parser.parse_script(task["script"])
+    generated = _read_json(queue.job_path(task["job_id"], "scenes.json"))
+    # repair_scene validates each scene (unless generate already did) and regenerates the ones that fail
+    scene_code = [
+        generator.repair_scene(scene, entry["prompt"], entry["code"], i, errors=entry.get("errors"))
+        for i, (scene, entry) in enumerate(zip(scenes, generated))
+    ]
+    path = queue.job_path(task["job_id"], "video.py")
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(generator.assemble_code(scene_code))
+    os.replace(tmp_path, path)
+    return path
+
+
+def run_render(queue: JobQueue, task: Dict) -> str:
+    from render_scenes import render_module, PREVIEW_OVERRIDES, PREVIEW_QUALITY
+
+    options = task["options"]
+    video_path = queue.job_path(task["job_id"], "video.py")
+    preview_path = queue.job_path(task["job_id"], "preview.mp4")
+    # A retried render keeps the preview an earlier attempt already made of this video.py
+    preview_current = os.path.isfile(preview_path) and os.path.getmtime(preview_path) >= os.path.getmtime(video_path)
+    if options.get("preview") and not preview_current:
+        # A quick low-quality cut reviewers can open (status shows it) while the final render runs
+        render_module(
+            video_path,
+            quality=PREVIEW_QUALITY,
+            workers=options.get("render_workers"),
+            media_dir=queue.job_path(task["job_id"], "media"),
+            output_path=preview_path,
+            config_overrides=PREVIEW_OVERRIDES
+        )
+    result = render_module(
+        video_path,
+        quality=options.get("quality", "medium_quality"),
+        workers=options.get("render_workers"),
+        media_dir=queue.job_path(task["job_id"], "media"),
+        output_path=queue.job_path(task["job_id"], "video.mp4")
+    )
+    failures = [f"{scene['scene']}: {scene['error']}" for scene in result["scenes"] if scene["error"]]
+    if failures:
+        raise RuntimeError("; ".join(failures))
+    return result["output_path"]
+
+
+STAGE_HANDLERS = {"retrieve": run_retrieve, "generate": run_generate, "validate": run_validate, "render": run_render}
+
+
+def _renew_lease(queue: JobQueue, task: Dict, worker: str, done: threading.Event):
+    while not done.wait(LEASE_SECONDS / 3):
+        if not queue.renew(task["job_id"], task["stage"], worker):
+            return
+
+
+def run_worker(stage: str, db_path: str = JOB_DB_PATH, job_dir: str = JOB_DIR, poll_interval: float = 1.0,
+               until_idle: bool = False):
+    """
+    Claims and runs tasks of one stage until interrupted (or, with
+    until_idle, until no job is left that could still reach this stage).
+    """
+    queue = JobQueue(db_path, job_dir)
+    worker = f"{socket.gethostname()}:{os.getpid()}:{stage}"
+    handler = STAGE_HANDLERS[stage]
+    try:
+        while True:
+            task = queue.claim(stage, worker)
+            if task is None:
+                if until_idle and not queue.pending():
+                    return
+                time.sleep(poll_interval)
+                continue
+
+            print(f"[{worker}] {stage} job {task['job_id']} (attempt {task['attempt']})")
+            done = threading.Event()
+            heartbeat = threading.Thread(target=_renew_lease, args=(queue, task, worker, done), daemon=True)
+            heartbeat.start()
+            try:
+                with span(f"job.{stage}", job_id=task["job_id"], attempt=task["attempt"]):
+                    output = handler(queue, task)
+            except Exception as e:
+                retrying = queue.fail(task["job_id"], stage, worker, f"{type(e).__name__}: {e}")
+                print(f"[{worker}] {stage} job {task['job_id']} failed: {e}" + (" (will retry)" if retrying else ""))
+            else:
+                queue.complete(task["job_id"], stage, worker, output)
+            finally:
+                done.set()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if _generator is not None:
+            _generator.close()
+        queue.close()
+
+
+def run_pools(pool_sizes: Optional[Dict[str, int]] = None, db_path: str = JOB_DB_PATH, job_dir: str = JOB_DIR,
+              until_idle: bool = False):
+    """
+    Starts a pool of worker processes per stage, so LLM-bound generation,
+    CPU-bound validation and rendering, and the embedder-holding retrieval
+    workers are sized independently. Blocks until the workers exit.
+    """
+    pool_sizes = dict(DEFAULT_POOL_SIZES, **(pool_sizes or {}))
+    if pool_sizes.get("retrieve", 0) > 1 and not os.getenv("RETRIEVAL_URL"):
+        # Each local Retriever loads its own model and opens the Chroma store; share one server instead
+        raise ValueError("Several retrieve workers need a shared retrieval server: set RETRIEVAL_URL")
+    JobQueue(db_path, job_dir).close()  # Create the schema before the workers race to
+    workers = [
+        Process(target=run_worker, args=(stage, db_path, job_dir), kwargs={"until_idle": until_idle},
+                name=f"{stage}-{i}")
+        for stage in STAGES for i in range(pool_sizes.get(stage, 0))
+    ]
+    for process in workers:
+        process.start()
+    try:
+        for process in workers:
+            process.join()
+    except KeyboardInterrupt:
+        for process in workers:
+            process.join()
+
+
+def format_status(status: Dict) -> str:
+    stages = " ".join(f"{stage}={info['status']}" for stage, info in status["stages"].items())
+    line = f"{status['id']} {status['status']:<8} {status['progress']:>4.0%} p{status['priority']} {stages}"
+    if status["result"]:
+        line += f" -> {status['result']}"
+    elif status["preview"]:
+        line += f" (preview: {status['preview']})"
+    if status["error"]:
+        line += f" ({status['error']})"
+    return line
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Queue scripts and run the text-to-video workers.")
+    arg_parser.add_argument("--db", default=JOB_DB_PATH)
+    arg_parser.add_argument("--job-dir", default=JOB_DIR)
+    commands = arg_parser.add_subparsers(dest="command", required=True)
+
+    submit_parser = commands.add_parser("submit", help="Queue a script file")
+    submit_parser.add_argument("script_file")
+    submit_parser.add_argument("--priority", type=int, default=0)
+    submit_parser.add_argument("--quality", default="medium_quality")
+    submit_parser.add_argument("--max-attempts", type=int, default=3)
+    submit_parser.add_argument("--candidates", type=int, default=1, help="Completions raced per scene")
+    submit_parser.add_argument("--preview", action="store_true", help="Render a low-quality preview first")
+
+    retry_parser = commands.add_parser("retry", help="Requeue a failed job from the stage that failed")
+    retry_parser.add_argument("job_id")
+
+    status_parser = commands.add_parser("status", help="Show one job, or the most recent jobs")
+    status_parser.add_argument("job_id", nargs="?")
+    status_parser.add_argument("--state", default=None, help="Only jobs in this state")
+
+    work_parser = commands.add_parser("work", help="Run worker pools")
+    for stage in STAGES:
+        work_parser.add_argument(f"--{stage}", type=int, default=DEFAULT_POOL_SIZES[stage],
+                                 help=f"{stage} workers")
+    work_parser.add_argument("--until-idle", action="store_true", help="Exit once every job has finished")
+    args = arg_parser.parse_args()
+
+    if args.command == "submit":
+        if args.candidates < 1:
+            submit_parser.error("--candidates must be at least 1")
+        with open(args.script_file, "r", encoding="utf-8") as f:
+            script = f.read()
+        job_queue = JobQueue(args.db, args.job_dir)
+        print(job_queue.submit(script, args.priority, {"quality": args.quality, "candidates": args.candidates, "preview": args.preview}, args.max_attempts))
+    elif args.command == "retry":
+        job_queue = JobQueue(args.db, args.job_dir)
+        print(f"Requeued {args.job_id}" if job_queue.retry(args.job_id) else f"Job {args.job_id} has not failed")
+    elif args.command == "status":
+        job_queue = JobQueue(args.db, args.job_dir)
+        if args.job_id:
+            status = job_queue.status(args.job_id)
+            print(json.dumps(status, indent=2) if status else f"No job {args.job_id}")
+        else:
+            for status in job_queue.list_jobs(args.state):
+                print(format_status(status))
+    else:
+        run_pools({stage: getattr(args, stage) for stage in STAGES}, args.db, args.job_dir, args.until_idle)
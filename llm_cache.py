@@ -0,0 +1,152 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional, Tuple
+
+import numpy as np
+
+LLM_CACHE_PATH = "./llm_cache.sqlite3"
+# Scene descriptions are embedded through the retriever's query cache, so repeats cost nothing
+SEMANTIC_CACHE_ENTRIES = 10000
+
+
+def _digest(*parts) -> str:
+    return hashlib.sha256(json.dumps(parts, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Persistent cache of LLM completions in SQLite.
+
+    Exact hits are keyed on (model, system prompt, rendered prompt,
+    temperature, max_tokens). Entries expire after ttl seconds and the least
+    recently used ones are evicted beyond max_entries.
+
+    With an embedder (anything with a SentenceTransformer-style encode, e.g.
+    embedding_cache.CachedEmbedder) a semantic tier is enabled as well: a
+    miss falls back to the stored entry with the same generation settings
+    whose scene description has cosine similarity >= semantic_threshold.
+    """
+
+    def __init__(self, path: str = LLM_CACHE_PATH, ttl: Optional[float] = 7 * 24 * 3600,
+                 max_entries: int = 5000, embedder=None, semantic_threshold: float = 0.97):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.embedder = embedder
+        self.semantic_threshold = semantic_threshold
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, params_key TEXT, content TEXT, "
+            "created_at REAL, last_access REAL, embedding BLOB)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_params ON responses (params_key)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_access ON responses (last_access)")
+        self._conn.commit()
+
+    def _expired(self, created_at: float, now: float) -> bool:
+        return self.ttl is not None and now - created_at > self.ttl
+
+    def _embed(self, text: str) -> np.ndarray:
+        vector = np.asarray(self.embedder.encode([text]), dtype=np.float32)[0]
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def get(self, model: str, system: str, prompt: str, temperature: float, max_tokens: int,
+            semantic_text: Optional[str] = None) -> Optional[str]:
+        key = _digest(model, system, prompt, temperature, max_tokens)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT content, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row and not self._expired(row[1], now):
+                self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+                self._conn.commit()
+                return row[0]
+
+        if self.embedder is None or not semantic_text:
+            return None
+        match = self._semantic_match(_digest(model, system, temperature, max_tokens), semantic_text, now)
+        if match is None:
+            return None
+        with self._lock:
+            self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, match[0]))
+            self._conn.commit()
+        return match[1]
+
+    def _semantic_match(self, params_key: str, semantic_text: str, now: float) -> Optional[Tuple[str, str]]:
+        """(key, content) of the closest live entry at or above semantic_threshold"""
+        query = self._embed(semantic_text)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key, content, created_at, embedding FROM responses "
+                "WHERE params_key = ? AND embedding IS NOT NULL", (params_key,)
+            ).fetchall()
+        rows = [row for row in rows if not self._expired(row[2], now)]
+        if not rows:
+            return None
+        matrix = np.stack([np.frombuffer(row[3], dtype=np.float32) for row in rows])
+        scores = matrix @ query
+        best = int(np.argmax(scores))
+        if scores[best] < self.semantic_threshold:
+            return None
+        return rows[best][0], rows[best][1]
+
+    def put(self, model: str, system: str, prompt: str, temperature: float, max_tokens: int,
+            content: str, semantic_text: Optional[str] = None):
+        key = _digest(model, system, prompt, temperature, max_tokens)
+        params_key = _digest(model, system, temperature, max_tokens)
+        embedding = None
+        if self.embedder is not None and semantic_text:
+            embedding = self._embed(semantic_text).tobytes()
+
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                (key, params_key, content, now, now, embedding)
+            )
+            if self.ttl is not None:
+                self._conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl,))
+            # Keep only the max_entries most recently used responses
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN ("
+                "SELECT key FROM responses ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+            self._conn.commit()
+
+    def delete(self, model: str, system: str, prompt: str, temperature: float, max_tokens: int,
+               semantic_text: Optional[str] = None):
+        """Drops the entry get() would return for these arguments, e.g. code that failed validation"""
+        keys = [_digest(model, system, prompt, temperature, max_tokens)]
+        if self.embedder is not None and semantic_text:
+            match = self._semantic_match(_digest(model, system, temperature, max_tokens), semantic_text, time.time())
+            if match is not None:
+                keys.append(match[0])
+        with self._lock:
+            self._conn.executemany("DELETE FROM responses WHERE key = ?", [(key,) for key in keys])
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def load_response_cache(path: str = LLM_CACHE_PATH, semantic: Optional[bool] = None) -> ResponseCache:
+    """
+    The response cache, with the semantic tier on the MiniLM embedder when
+    semantic is set (by default when SEMANTIC_RESPONSE_CACHE is set).
+    """
+    if semantic is None:
+        semantic = bool(os.getenv("SEMANTIC_RESPONSE_CACHE"))
+    embedder = None
+    if semantic:
+        from embedding_cache import load_embedder, QUERY_CACHE_PATH
+
+        embedder = load_embedder(QUERY_CACHE_PATH, max_entries=SEMANTIC_CACHE_ENTRIES, shared=True)
+    return ResponseCache(path, embedder=embedder)
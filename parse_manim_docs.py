@@ -1,8 +1,13 @@
 import os
+import argparse
 from bs4 import BeautifulSoup
+from multiprocessing import Pool
 import json
+from symbol_index import SymbolIndexBuilder, SYMBOL_INDEX_PATH
+from tracing import span
 
-DOCS_PATH = "/Users/aryankix101/Desktop/EduTok/manim-docs/docs.manim.community/en/stable"
+# Docs root can be overridden with MANIM_DOCS_PATH or --docs-root
+DOCS_PATH = os.getenv("MANIM_DOCS_PATH", "manim-docs/docs.manim.community/en/stable")
 
 def parse_html_file(file_path):
     with open(file_path, "r", encoding="utf-8") as f:
@@ -29,31 +34,81 @@ def parse_html_file(file_path):
     
     code_blocks = []
     for code_block in main_content_div.find_all("div", class_="highlight"):
-        code_text = code_block.get_text(separator="\n")
+        # Highlighted code is one span per token; join them as-is to keep the original layout
+        code_text = code_block.get_text()
         code_blocks.append(code_text)
 
     return clean_text, code_blocks
 
-def main():
-    all_docs = []
-
-    # Traverse all .html files
-    for root, dirs, files in os.walk(DOCS_PATH):
+def iter_html_files(docs_root):
+    """Yield every .html file path under docs_root."""
+    for root, dirs, files in os.walk(docs_root):
         for file in files:
             if file.endswith(".html"):
-                html_file_path = os.path.join(root, file)
-                text_content, code_blocks = parse_html_file(html_file_path)
+                yield os.path.join(root, file)
+
+def parse_doc(html_file_path):
+    """Parse one file into the record format written to manim_docs.json(l)."""
+    with span("parse", file=html_file_path):
+        text_content, code_blocks = parse_html_file(html_file_path)
+    return {
+        "file_path": html_file_path,
+        "text": text_content,
+        "code_blocks": code_blocks
+    }
+
+def save_symbol_index(builder, symbol_index_path):
+    index = builder.build()
+    index.save(symbol_index_path)
+    print(f"Indexed {len(index)} Manim symbols in {symbol_index_path}")
+
+def main(docs_root=DOCS_PATH, output_path="manim_docs.json", symbol_index_path=SYMBOL_INDEX_PATH):
+    all_docs = []
+    symbols = SymbolIndexBuilder()
 
-                all_docs.append({
-                    "file_path": html_file_path,
-                    "text": text_content,
-                    "code_blocks": code_blocks
-                })
+    # Traverse all .html files
+    for html_file_path in iter_html_files(docs_root):
+        doc = parse_doc(html_file_path)
+        all_docs.append(doc)
+        symbols.add(doc)
 
     print(f"Parsed {len(all_docs)} documents.")
 
-    with open("manim_docs.json", "w", encoding="utf-8") as out_f:
+    with open(output_path, "w", encoding="utf-8") as out_f:
         json.dump(all_docs, out_f, ensure_ascii=False, indent=2)
+    save_symbol_index(symbols, symbol_index_path)
+
+def main_parallel(docs_root=DOCS_PATH, output_path="manim_docs.jsonl", workers=None, chunksize=8,
+                  symbol_index_path=SYMBOL_INDEX_PATH):
+    """
+    Parses the docs on a process pool and streams one JSON Lines record per
+    file as soon as it is parsed, so memory stays flat as the mirror grows.
+    """
+    count = 0
+    symbols = SymbolIndexBuilder()
+    with Pool(processes=workers) as pool, open(output_path, "w", encoding="utf-8") as out_f:
+        # imap_unordered hands back each record as soon as its worker finishes
+        for doc in pool.imap_unordered(parse_doc, iter_html_files(docs_root), chunksize=chunksize):
+            out_f.write(json.dumps(doc, ensure_ascii=False))
+            out_f.write("\n")
+            symbols.add(doc)
+            count += 1
+
+    print(f"Parsed {count} documents.")
+    save_symbol_index(symbols, symbol_index_path)
 
 if __name__ == "__main__":
-    main()
+    arg_parser = argparse.ArgumentParser(description="Parse the Manim HTML docs mirror.")
+    arg_parser.add_argument("--docs-root", default=DOCS_PATH)
+    arg_parser.add_argument("--output", default=None)
+    arg_parser.add_argument("--parallel", action="store_true",
+                            help="Parse on a process pool and write JSON Lines output")
+    arg_parser.add_argument("--workers", type=int, default=None)
+    arg_parser.add_argument("--symbol-index", default=SYMBOL_INDEX_PATH)
+    args = arg_parser.parse_args()
+
+    if args.parallel:
+        main_parallel(args.docs_root, args.output or "manim_docs.jsonl", args.workers,
+                      symbol_index_path=args.symbol_index)
+    else:
+        main(args.docs_root, args.output or "manim_docs.json", symbol_index_path=args.symbol_index)
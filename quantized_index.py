@@ -0,0 +1,286 @@
+import argparse
+import json
+import os
+import random
+import time
+from typing import Callable, Dict, List
+
+import numpy as np
+
+# Stored inside the Chroma directory it indexes, like the BM25 index
+QUANTIZED_DIRNAME = "quantized_index"
+# Rows scored per block during the approximate scan; bounds the float32 scratch memory
+SCAN_BLOCK_ROWS = 65536
+RERANK_FACTOR = 8
+
+
+def quantized_index_path(chroma_path: str) -> str:
+    """Where the int8 index of the collection at chroma_path lives"""
+    return os.path.join(chroma_path, QUANTIZED_DIRNAME)
+
+
+def has_exact_vectors(path: str) -> bool:
+    return os.path.isfile(os.path.join(path, "vectors.f32"))
+
+
+class QuantizedIndex:
+    """
+    Compact vector index for the ingested chunks.
+
+    codes.i8 holds every embedding scalar-quantized to int8 with one scale
+    per dimension (a quarter of float32's size), norms.f32 the squared norms
+    of the exact vectors, and meta.json the ids and scales. Re-ranking is
+    opt-in: built with exact_vectors, vectors.f32 keeps the float32 vectors
+    and search re-ranks its best candidates with them, reading only those
+    rows. Both files are memory-mapped, so loading is instant and a scan
+    pages in only the codes. Distances are squared L2, like the default
+    Chroma collection.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.codes_path = os.path.join(path, "codes.i8")
+        self.vectors_path = os.path.join(path, "vectors.f32")
+        self.norms_path = os.path.join(path, "norms.f32")
+        self.meta_path = os.path.join(path, "meta.json")
+        self.ids: List[str] = []
+        self.dim = 0
+        self.scales = np.zeros(0, dtype=np.float32)
+        self.norms = np.zeros(0, dtype=np.float32)
+        self.codes = None
+        self.vectors = None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @classmethod
+    def load(cls, path: str) -> "QuantizedIndex":
+        index = cls(path)
+        with open(index.meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        index.ids = meta["ids"]
+        index.dim = meta["dim"]
+        index.scales = np.array(meta["scales"], dtype=np.float32)
+        index.norms = np.fromfile(index.norms_path, dtype=np.float32)
+        if index.ids:
+            shape = (len(index.ids), index.dim)
+            index.codes = np.memmap(index.codes_path, dtype=np.int8, mode="r", shape=shape)
+            if os.path.isfile(index.vectors_path):
+                index.vectors = np.memmap(index.vectors_path, dtype=np.float32, mode="r", shape=shape)
+        return index
+
+    @classmethod
+    def build(cls, pages: Callable, path: str, exact_vectors: bool = False) -> "QuantizedIndex":
+        """
+        Quantizes the vectors yielded by pages(), a callable returning an
+        iterator of (ids, float32 embeddings) pages. It is called twice: once
+        for the per-dimension scales and once to write the codes (and, with
+        exact_vectors, the float32 copy used for re-ranking).
+        """
+        os.makedirs(path, exist_ok=True)
+        index = cls(path)
+        max_abs = None
+        for _, block in pages():
+            block_max = np.abs(block).max(axis=0)
+            max_abs = block_max if max_abs is None else np.maximum(max_abs, block_max)
+        dim = 0 if max_abs is None else len(max_abs)
+        scales = np.ones(dim, dtype=np.float32) if max_abs is None else \
+            np.where(max_abs > 0, max_abs / 127.0, 1.0).astype(np.float32)
+
+        ids = []
+        norms = []
+        tmp_codes = index.codes_path + ".tmp"
+        tmp_vectors = index.vectors_path + ".tmp"
+        vectors_file = open(tmp_vectors, "wb") if exact_vectors else None
+        try:
+            with open(tmp_codes, "wb") as f:
+                for page_ids, block in pages():
+                    f.write(np.clip(np.rint(block / scales), -127, 127).astype(np.int8).tobytes())
+                    if vectors_file is not None:
+                        vectors_file.write(block.tobytes())
+                    norms.append(np.einsum("ij,ij->i", block, block))
+                    ids.extend(page_ids)
+        finally:
+            if vectors_file is not None:
+                vectors_file.close()
+        os.replace(tmp_codes, index.codes_path)
+        if exact_vectors:
+            os.replace(tmp_vectors, index.vectors_path)
+        elif os.path.exists(index.vectors_path):
+            os.remove(index.vectors_path)
+        (np.concatenate(norms) if norms else np.zeros(0)).astype(np.float32).tofile(index.norms_path)
+
+        tmp_meta = index.meta_path + ".tmp"
+        with open(tmp_meta, "w", encoding="utf-8") as f:
+            json.dump({"ids": list(ids), "dim": dim, "scales": scales.tolist()}, f)
+        os.replace(tmp_meta, index.meta_path)
+        return cls.load(path)
+
+    def search(self, query_embeddings, n_results: int = 5, rerank_factor: int = RERANK_FACTOR) -> Dict:
+        """
+        Approximate search: ranks every row by its int8 code. If the index
+        has exact vectors and rerank_factor > 0, the best
+        n_results * rerank_factor are re-ranked with them. Returns
+        {"ids", "distances"}, one list per query.
+        """
+        queries = np.asarray(query_embeddings, dtype=np.float32).reshape(-1, self.dim)
+        if not self.ids:
+            return {"ids": [[] for _ in queries], "distances": [[] for _ in queries]}
+
+        rows = len(self.ids)
+        weights = queries * self.scales
+        # ||x - q||^2 = ||x||^2 - 2 x.q + ||q||^2; the last term does not change the ranking
+        scores = np.empty((len(queries), rows), dtype=np.float32)
+        for start in range(0, rows, SCAN_BLOCK_ROWS):
+            block = np.asarray(self.codes[start:start + SCAN_BLOCK_ROWS], dtype=np.float32)
+            scores[:, start:start + len(block)] = self.norms[start:start + len(block)] - 2 * (weights @ block.T)
+
+        rerank = self.vectors is not None and rerank_factor > 0
+        n_candidates = min(rows, n_results * rerank_factor if rerank else n_results)
+        all_ids, all_distances = [], []
+        for query, row_scores in zip(queries, scores):
+            candidates = np.argpartition(row_scores, n_candidates - 1)[:n_candidates]
+            if rerank:
+                # Sorted rows keep the reads from the memory-mapped file sequential
+                candidates.sort()
+                distances = ((np.asarray(self.vectors[candidates]) - query) ** 2).sum(axis=1)
+            else:
+                distances = row_scores[candidates] + np.dot(query, query)
+            order = np.argsort(distances)[:n_results]
+            all_ids.append([self.ids[i] for i in candidates[order]])
+            all_distances.append(distances[order].tolist())
+        return {"ids": all_ids, "distances": all_distances}
+
+    def nbytes(self) -> Dict[str, int]:
+        return {
+            "codes": os.path.getsize(self.codes_path),
+            "vectors": os.path.getsize(self.vectors_path) if self.vectors is not None else 0,
+            "norms": os.path.getsize(self.norms_path),
+            "meta": os.path.getsize(self.meta_path)
+        }
+
+
+def collection_pages(collection, page_size: int = 5000):
+    """Yields (ids, float32 embeddings) for every chunk of a Chroma collection, page by page"""
+    offset = 0
+    while True:
+        page = collection.get(include=["embeddings"], limit=page_size, offset=offset)
+        if not len(page["ids"]):
+            break
+        yield page["ids"], np.asarray(page["embeddings"], dtype=np.float32)
+        offset += len(page["ids"])
+
+
+def build_from_collection(collection, path: str, exact_vectors: bool = False,
+                          page_size: int = 5000) -> QuantizedIndex:
+    """Quantizes every embedding of a Chroma collection, reading it page by page"""
+    return QuantizedIndex.build(lambda: collection_pages(collection, page_size), path, exact_vectors)
+
+
+def exact_search(collection, query_embeddings, n_results: int = 5) -> List[List[str]]:
+    """Ids of the true nearest neighbours, from a float32 scan of the whole collection"""
+    queries = np.asarray(query_embeddings, dtype=np.float32)
+    best_ids = [[] for _ in queries]
+    best_distances = [np.zeros(0, dtype=np.float32) for _ in queries]
+    for ids, block in collection_pages(collection):
+        # ||x||^2 - 2 x.q; ||q||^2 is the same for every row of a query
+        distances = np.einsum("ij,ij->i", block, block) - 2 * (queries @ block.T)
+        for i, row in enumerate(distances):
+            merged_ids = best_ids[i] + list(ids)
+            merged = np.concatenate([best_distances[i], row])
+            order = np.argsort(merged)[:n_results]
+            best_ids[i] = [merged_ids[j] for j in order]
+            best_distances[i] = merged[order]
+    return best_ids
+
+
+def _directory_size(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, files in os.walk(path) for name in files)
+
+
+def _latency_stats(seconds: List[float]) -> Dict[str, float]:
+    ms = np.array(seconds) * 1000
+    return {"p50_ms": float(np.percentile(ms, 50)), "p95_ms": float(np.percentile(ms, 95))}
+
+
+def benchmark(collection, index: QuantizedIndex, query_embeddings, n_results: int = 5,
+              rerank_factors=(1, 4, RERANK_FACTOR, 16)) -> Dict:
+    """
+    Recall@n_results and per-query latency of the Chroma collection and of
+    the quantized index without re-ranking and (if it has exact vectors) at
+    several re-rank depths, measured against an exact float32 scan of the
+    same vectors.
+    """
+    truth = exact_search(collection, query_embeddings, n_results)
+
+    def run(search):
+        hits, seconds = 0, []
+        for query, expected in zip(query_embeddings, truth):
+            started = time.perf_counter()
+            found = search(query)
+            seconds.append(time.perf_counter() - started)
+            hits += len(set(found) & set(expected))
+        return dict(recall=hits / (len(truth) * n_results), **_latency_stats(seconds))
+
+    results = {
+        "queries": len(truth),
+        "rows": len(index),
+        "n_results": n_results,
+        "chroma": run(lambda q: collection.query(query_embeddings=[q.tolist()], n_results=n_results)["ids"][0]),
+        "quantized": {}
+    }
+    results["quantized"]["no_rerank"] = run(lambda q: index.search(q, n_results, rerank_factor=0)["ids"][0])
+    for factor in rerank_factors if index.vectors is not None else ():
+        results["quantized"][f"rerank_x{factor}"] = run(
+            lambda q: index.search(q, n_results, rerank_factor=factor)["ids"][0]
+        )
+
+    started = time.perf_counter()
+    QuantizedIndex.load(index.path)
+    results["quantized_load_ms"] = (time.perf_counter() - started) * 1000
+    results["bytes"] = dict(index.nbytes())
+    return results
+
+
+def sample_queries(collection, model, count: int = 200, words: int = 12, seed: int = 0) -> np.ndarray:
+    """Query embeddings for random word windows cut from stored chunks"""
+    rng = random.Random(seed)
+    total = collection.count()
+    texts = []
+    for offset in rng.sample(range(total), min(count, total)):
+        words_in_chunk = collection.get(limit=1, offset=offset, include=["documents"])["documents"][0].split()
+        start = rng.randrange(max(1, len(words_in_chunk) - words))
+        texts.append(" ".join(words_in_chunk[start:start + words]))
+    return np.asarray(model.encode(texts), dtype=np.float32)
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Build the int8 index and benchmark it against Chroma.")
+    arg_parser.add_argument("--chroma-path", default="./chroma_db")
+    arg_parser.add_argument("--collection", default="manim_docs")
+    arg_parser.add_argument("--index-path", default=None, help="Default: <chroma-path>/quantized_index")
+    arg_parser.add_argument("--rebuild", action="store_true")
+    arg_parser.add_argument("--no-exact-vectors", action="store_true",
+                            help="Rebuild without vectors.f32 (only the no-rerank mode is measured)")
+    arg_parser.add_argument("--queries", type=int, default=200)
+    arg_parser.add_argument("--n-results", type=int, default=5)
+    arg_parser.add_argument("--output", default=None, help="Also write the results to this JSON file")
+    args = arg_parser.parse_args()
+
+    import chromadb
+    from embedding_cache import load_embedder
+
+    index_path = args.index_path or quantized_index_path(args.chroma_path)
+    collection = chromadb.PersistentClient(path=args.chroma_path).get_collection(args.collection)
+    if args.rebuild or not os.path.isfile(os.path.join(index_path, "meta.json")):
+        index = build_from_collection(collection, index_path, exact_vectors=not args.no_exact_vectors)
+    else:
+        index = QuantizedIndex.load(index_path)
+
+    queries = sample_queries(collection, load_embedder(), args.queries)
+    results = benchmark(collection, index, queries, args.n_results)
+    results["bytes"]["chroma_dir"] = _directory_size(args.chroma_path)
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
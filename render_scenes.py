@@ -0,0 +1,411 @@
+import argparse
+import ast
+import copy
+import hashlib
+import importlib.metadata
+import importlib.util
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from tracing import get_tracer
+
+DEFAULT_MEDIA_DIR = "./media"
+RENDER_CACHE_DIR = "./render_cache"
+QUALITIES = ("low_quality", "medium_quality", "high_quality", "production_quality", "fourk_quality")
+PREVIEW_QUALITY = "low_quality"
+# On top of low_quality's 480p: fewer frames to draw and encode, still enough to judge timing
+PREVIEW_OVERRIDES = {"frame_rate": 10}
+
+_loaded_modules = {}
+
+
+def discover_scenes(module_path: str) -> List[str]:
+    """
+    Returns the Scene subclasses defined in a module, in source order, without
+    importing it (so the parent process never has to load manim).
+    """
+    with open(module_path, "r", encoding="utf-8") as f:
+        tree = ast.parse(f.read(), filename=module_path)
+
+    return [node.name for node in _scene_classes(tree)]
+
+
+def _base_names(node: ast.ClassDef) -> List[str]:
+    return [base.id if isinstance(base, ast.Name) else getattr(base, "attr", None) for base in node.bases]
+
+
+def _scene_classes(tree: ast.Module) -> List[ast.ClassDef]:
+    scene_classes = []
+    known = {"Scene", "MovingCameraScene", "ThreeDScene", "ZoomedScene", "VectorScene", "LinearTransformationScene"}
+    for node in tree.body:
+        if isinstance(node, ast.ClassDef) and known.intersection(_base_names(node)):
+            known.add(node.name)
+            scene_classes.append(node)
+    return scene_classes
+
+
+def _is_main_guard(node: ast.stmt) -> bool:
+    return (isinstance(node, ast.If) and isinstance(node.test, ast.Compare)
+            and isinstance(node.test.left, ast.Name) and node.test.left.id == "__name__")
+
+
+def _manim_version() -> str:
+    try:
+        return importlib.metadata.version("manim")
+    except importlib.metadata.PackageNotFoundError:
+        return "unknown"
+
+
+def scene_cache_keys(module_path: str, scene_names: List[str], quality: str,
+                     config_overrides: Optional[Dict] = None) -> Dict[str, str]:
+    """
+    Content-addressed render cache keys for the given scenes.
+
+    Each key hashes the normalized AST of the scene class (formatting,
+    comments and the class's own name do not matter), the in-module base
+    classes it inherits from, the module-level code every scene shares
+    (imports, helpers, constants; the __main__ block and the other scenes
+    are left out), the render settings and the manim version. Names that
+    are not a scene class defined in the module get no key (and so are
+    never cached).
+    """
+    with open(module_path, "r", encoding="utf-8") as f:
+        tree = ast.parse(f.read(), filename=module_path)
+
+    scene_nodes = {node.name: node for node in _scene_classes(tree)}
+    shared = [
+        ast.dump(node) for node in tree.body
+        if not _is_main_guard(node) and not (isinstance(node, ast.ClassDef) and node.name in scene_nodes)
+    ]
+    settings = json.dumps({"quality": quality, "overrides": config_overrides or {}, "manim": _manim_version()},
+                          sort_keys=True)
+
+    keys = {}
+    for name in scene_names:
+        if name not in scene_nodes:
+            # e.g. a scene built at runtime or imported from elsewhere: nothing to hash
+            continue
+        parts = list(shared)
+        node = scene_nodes[name]
+        anonymous = copy.copy(node)
+        anonymous.name = ""
+        parts.append(ast.dump(anonymous))
+        # Include in-module parents so a change to a base scene invalidates subclasses
+        bases = [base for base in _base_names(node) if base in scene_nodes]
+        while bases:
+            base = scene_nodes[bases.pop()]
+            parts.append(ast.dump(base))
+            bases.extend(b for b in _base_names(base) if b in scene_nodes)
+        parts.append(settings)
+        keys[name] = hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
+    return keys
+
+
+def _cache_path(cache_dir: str, key: str) -> str:
+    return os.path.join(cache_dir, f"{key}.mp4")
+
+
+def _store_in_cache(cache_dir: str, key: str, output_path: str):
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = _cache_path(cache_dir, key) + ".tmp"
+    shutil.copyfile(output_path, tmp_path)
+    os.replace(tmp_path, _cache_path(cache_dir, key))
+
+
+def _load_module(module_path: str):
+    module_path = os.path.abspath(module_path)
+    if module_path not in _loaded_modules:
+        name = os.path.splitext(os.path.basename(module_path))[0]
+        spec = importlib.util.spec_from_file_location(name, module_path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        _loaded_modules[module_path] = module
+    return _loaded_modules[module_path]
+
+
+def render_scene(module_path: str, scene_name: str, quality: str = "medium_quality",
+                 media_dir: str = DEFAULT_MEDIA_DIR, config_overrides: Optional[Dict] = None) -> Dict:
+    """
+    Renders one scene in the current process. Meant to run on a pool worker;
+    manim's global config is only touched inside tempconfig.
+    Returns {"scene", "output_path", "error", "seconds"}.
+    """
+    from manim import tempconfig
+
+    started = time.perf_counter()
+    try:
+        scene_cls = getattr(_load_module(module_path), scene_name)
+        options = {"quality": quality, "media_dir": media_dir}
+        options.update(config_overrides or {})
+        with tempconfig(options):
+            scene = scene_cls()
+            scene.render()
+            output_path = str(scene.renderer.file_writer.movie_file_path)
+        return {"scene": scene_name, "output_path": output_path, "error": None,
+                "seconds": time.perf_counter() - started}
+    except Exception as e:
+        return {"scene": scene_name, "output_path": None, "error": f"{type(e).__name__}: {e}",
+                "seconds": time.perf_counter() - started}
+
+
+def render_keyframes(module_path: str, scene_name: str, media_dir: str = DEFAULT_MEDIA_DIR) -> Dict:
+    """
+    Renders one scene as PNG stills, one after every self.play and
+    self.wait, with animations skipped and no video encoded. Returns
+    {"scene", "frames", "error", "seconds"}.
+    """
+    from manim import tempconfig
+    from PIL import Image
+
+    started = time.perf_counter()
+    frame_dir = os.path.join(media_dir, "keyframes", scene_name)
+    shutil.rmtree(frame_dir, ignore_errors=True)
+    os.makedirs(frame_dir)
+    frames = []
+    try:
+        scene_cls = getattr(_load_module(module_path), scene_name)
+
+        class Keyframes(scene_cls):
+            # Scene.wait plays a Wait animation; its frame is saved once, by wait
+            waiting = False
+
+            def keyframe(self):
+                self.renderer.update_frame(self)
+                path = os.path.join(frame_dir, f"{len(frames):03d}.png")
+                Image.fromarray(self.renderer.get_frame()).save(path)
+                frames.append(path)
+
+            def play(self, *args, **kwargs):
+                super().play(*args, **kwargs)
+                if not self.waiting:
+                    self.keyframe()
+
+            def wait(self, *args, **kwargs):
+                self.waiting = True
+                try:
+                    super().wait(*args, **kwargs)
+                finally:
+                    self.waiting = False
+                self.keyframe()
+
+        # manim names its output files after the scene class
+        Keyframes.__name__ = Keyframes.__qualname__ = scene_name
+        # save_last_frame makes the renderer jump to the end of each animation instead of drawing it
+        options = {"quality": PREVIEW_QUALITY, "media_dir": media_dir, "write_to_movie": False,
+                   "save_last_frame": True}
+        with tempconfig(options):
+            Keyframes().render()
+        return {"scene": scene_name, "frames": frames, "error": None, "seconds": time.perf_counter() - started}
+    except Exception as e:
+        return {"scene": scene_name, "frames": frames, "error": f"{type(e).__name__}: {e}",
+                "seconds": time.perf_counter() - started}
+
+
+def concatenate_movies(paths: List[str], output_path: str) -> str:
+    """Joins rendered clips in the given order with ffmpeg's concat demuxer (no re-encode)"""
+    with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as list_file:
+        for path in paths:
+            escaped = os.path.abspath(path).replace("'", "'\\''")
+            list_file.write(f"file '{escaped}'\n")
+    try:
+        subprocess.run(
+            ["ffmpeg", "-y", "-loglevel", "error", "-f", "concat", "-safe", "0",
+             "-i", list_file.name, "-c", "copy", output_path],
+            check=True
+        )
+    finally:
+        os.remove(list_file.name)
+    return output_path
+
+
+def _future_result(scene_name: str, future) -> Dict:
+    """A render_scene future's result, or the exception (e.g. BrokenProcessPool) as that scene's error"""
+    try:
+        return future.result()
+    except Exception as e:
+        return {"scene": scene_name, "output_path": None, "error": f"{type(e).__name__}: {e}", "seconds": 0.0}
+
+
+def render_module(module_path: str, scene_names: Optional[List[str]] = None, quality: str = "medium_quality",
+                  workers: Optional[int] = None, media_dir: str = DEFAULT_MEDIA_DIR,
+                  output_path: Optional[str] = None, config_overrides: Optional[Dict] = None,
+                  cache_dir: Optional[str] = RENDER_CACHE_DIR) -> Dict:
+    """
+    Renders every scene of a module on a process pool and, if all of them
+    succeed, concatenates the clips in scene order into output_path
+    (default: <media_dir>/<module>_<quality>.mp4).
+
+    Scenes whose cache key (see scene_cache_keys) already has a clip in
+    cache_dir are not rendered again; pass cache_dir=None to always render.
+    Returns {"scenes": [per-scene results in order], "output_path": str or None}.
+    """
+    started = time.perf_counter()
+    scene_names = scene_names or discover_scenes(module_path)
+    keys = scene_cache_keys(module_path, scene_names, quality, config_overrides) if cache_dir else {}
+
+    results = {}
+    for name in scene_names:
+        if name in keys and os.path.isfile(_cache_path(cache_dir, keys[name])):
+            results[name] = {"scene": name, "output_path": _cache_path(cache_dir, keys[name]),
+                             "error": None, "seconds": 0.0, "cached": True}
+
+    to_render = [name for name in scene_names if name not in results]
+    if to_render:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {
+                name: pool.submit(render_scene, module_path, name, quality, media_dir, config_overrides)
+                for name in to_render
+            }
+            rendered = {name: _future_result(name, future) for name, future in futures.items()}
+        # A worker that died breaks the whole pool; give each scene it took down a pool of its own
+        broken = [name for name, result in rendered.items() if (result["error"] or "").startswith("BrokenProcessPool")]
+        batch_size = workers or os.cpu_count() or 1
+        for start in range(0, len(broken) if len(broken) > 1 else 0, batch_size):
+            pools = {name: ProcessPoolExecutor(max_workers=1) for name in broken[start:start + batch_size]}
+            try:
+                futures = {
+                    name: pool.submit(render_scene, module_path, name, quality, media_dir, config_overrides)
+                    for name, pool in pools.items()
+                }
+                rendered.update({name: _future_result(name, future) for name, future in futures.items()})
+            finally:
+                for pool in pools.values():
+                    pool.shutdown()
+        for name, result in rendered.items():
+            result["cached"] = False
+            # manim can exit cleanly without writing a video (e.g. a scene that never plays anything)
+            if name in keys and result["error"] is None and os.path.isfile(result["output_path"]):
+                _store_in_cache(cache_dir, keys[name], result["output_path"])
+            results[name] = result
+    results = [results[name] for name in scene_names]
+
+    tracer = get_tracer()
+    for result in results:
+        # Scenes are timed on the workers; record them as spans of this process
+        tracer.record("render.scene", result["seconds"], error=result["error"], scene=result["scene"],
+                      cached=result["cached"], quality=quality)
+        if result["error"]:
+            print(f"FAILED {result['scene']}: {result['error']}")
+        elif result["cached"]:
+            print(f"Reused cached render of {result['scene']} -> {result['output_path']}")
+        else:
+            print(f"Rendered {result['scene']} in {result['seconds']:.1f}s -> {result['output_path']}")
+
+    final_path = None
+    if results and all(result["error"] is None for result in results):
+        module_name = os.path.splitext(os.path.basename(module_path))[0]
+        final_path = output_path or os.path.join(media_dir, f"{module_name}_{quality}.mp4")
+        with tracer.span("render.concat", scenes=len(results)):
+            concatenate_movies([result["output_path"] for result in results], final_path)
+        print(f"Final video: {final_path}")
+
+    tracer.record("render", time.perf_counter() - started, module=module_path, scenes=len(scene_names),
+                  rendered=len(to_render), quality=quality)
+    return {"scenes": results, "output_path": final_path}
+
+
+def snapshot_module(module_path: str, media_dir: str = DEFAULT_MEDIA_DIR) -> str:
+    """
+    Copies a module to <media_dir>/snapshots/<content hash>/ and returns the
+    copy's path, so a render that finishes later uses exactly this source
+    even if the module is edited or regenerated in the meantime.
+    """
+    with open(module_path, "rb") as f:
+        source = f.read()
+    snapshot_dir = os.path.join(media_dir, "snapshots", hashlib.sha256(source).hexdigest()[:16])
+    snapshot_path = os.path.join(snapshot_dir, os.path.basename(module_path))
+    if not os.path.isfile(snapshot_path):
+        os.makedirs(snapshot_dir, exist_ok=True)
+        with open(snapshot_path + ".tmp", "wb") as f:
+            f.write(source)
+        os.replace(snapshot_path + ".tmp", snapshot_path)
+    return snapshot_path
+
+
+def render_preview(module_path: str, scene_names: Optional[List[str]] = None,
+                   final_quality: Optional[str] = "medium_quality", workers: Optional[int] = None,
+                   media_dir: str = DEFAULT_MEDIA_DIR, preview_path: Optional[str] = None,
+                   output_path: Optional[str] = None, stills: bool = False,
+                   cache_dir: Optional[str] = RENDER_CACHE_DIR) -> Dict:
+    """
+    Renders every scene at preview settings in parallel (or, with stills,
+    as keyframe PNGs) and returns as soon as the preview is ready. The
+    final-quality render of the same source then runs in the background
+    unless final_quality is None.
+
+    Returns {"preview": render_module-style result, "final": Future of the
+    final render_module result, or None}. Previews go to
+    <media_dir>/<module>_preview.mp4 unless preview_path is given.
+    """
+    snapshot_path = snapshot_module(module_path, media_dir)
+    scene_names = scene_names or discover_scenes(snapshot_path)
+    module_name = os.path.splitext(os.path.basename(module_path))[0]
+
+    with get_tracer().span("render.preview", scenes=len(scene_names), stills=stills):
+        if stills:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = [pool.submit(render_keyframes, snapshot_path, name, media_dir) for name in scene_names]
+                results = []
+                for name, future in zip(scene_names, futures):
+                    try:
+                        results.append(future.result())
+                    except Exception as e:
+                        results.append({"scene": name, "frames": [], "error": f"{type(e).__name__}: {e}",
+                                        "seconds": 0.0})
+            for result in results:
+                if result["error"]:
+                    print(f"FAILED {result['scene']}: {result['error']}")
+                else:
+                    print(f"{result['scene']}: {len(result['frames'])} keyframes in {result['seconds']:.1f}s")
+            preview = {"scenes": results, "output_path": os.path.join(media_dir, "keyframes")}
+        else:
+            preview = render_module(snapshot_path, scene_names, PREVIEW_QUALITY, workers, media_dir,
+                                    preview_path or os.path.join(media_dir, f"{module_name}_preview.mp4"),
+                                    PREVIEW_OVERRIDES, cache_dir)
+
+    final = None
+    if final_quality:
+        # One background thread; the renders themselves still run on render_module's process pool
+        upgrader = ThreadPoolExecutor(max_workers=1, thread_name_prefix="render-upgrade")
+        final = upgrader.submit(
+            render_module, snapshot_path, scene_names, final_quality, workers, media_dir, output_path,
+            None, cache_dir
+        )
+        upgrader.shutdown(wait=False)
+    return {"preview": preview, "final": final}
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Render the scenes of a Manim module in parallel.")
+    arg_parser.add_argument("module", help="Path to a module such as binary_search_video.py")
+    arg_parser.add_argument("scenes", nargs="*", help="Scene classes to render (default: all, in source order)")
+    arg_parser.add_argument("--quality", choices=QUALITIES, default="medium_quality")
+    arg_parser.add_argument("--workers", type=int, default=None)
+    arg_parser.add_argument("--media-dir", default=DEFAULT_MEDIA_DIR)
+    arg_parser.add_argument("--output", default=None)
+    arg_parser.add_argument("--cache-dir", default=RENDER_CACHE_DIR)
+    arg_parser.add_argument("--no-cache", action="store_true")
+    arg_parser.add_argument("--preview", action="store_true",
+                            help="Render a low-quality preview first, then --quality in the background")
+    arg_parser.add_argument("--stills", action="store_true", help="Preview as keyframe PNGs instead of a video")
+    arg_parser.add_argument("--no-upgrade", action="store_true", help="Stop after the preview")
+    args = arg_parser.parse_args()
+
+    cache_dir = None if args.no_cache else args.cache_dir
+    if args.preview or args.stills:
+        rendered = render_preview(args.module, args.scenes or None, None if args.no_upgrade else args.quality,
+                                  args.workers, args.media_dir, output_path=args.output, stills=args.stills,
+                                  cache_dir=cache_dir)
+        print(f"Preview ready: {rendered['preview']['output_path']}")
+        if rendered["final"] is not None:
+            print(f"Rendering {args.quality} in the background...")
+            rendered["final"].result()
+    else:
+        render_module(args.module, args.scenes or None, args.quality, args.workers, args.media_dir, args.output,
+                      cache_dir=cache_dir)
@@ -0,0 +1,167 @@
+import chromadb
+import hashlib
+import os
+from typing import Dict, List, Optional
+
+from embedding_cache import load_embedder, QUERY_CACHE_PATH
+from scene_parser import ParsedScene
+from bm25_index import BM25Index, bm25_path as default_bm25_path, reciprocal_rank_fusion
+from quantized_index import QuantizedIndex
+from tracing import span
+
+RESULT_KEYS = ("ids", "documents", "metadatas", "distances")
+# Each ranking contributes this many candidates per requested result to the fusion
+CANDIDATE_FACTOR = 4
+
+
+class Retriever:
+    """Owns the Chroma collection and the query embedder for one process"""
+
+    def __init__(self, chroma_path: str = "./chroma_db", collection_name: str = "manim_docs",
+                 cache_path: str = QUERY_CACHE_PATH, max_cache_entries: int = 10000,
+                 bm25_path: Optional[str] = None, hybrid: bool = True, quantized_path: Optional[str] = None):
+        self.client = chromadb.PersistentClient(path=chroma_path)
+        self.collection = self.client.get_collection(collection_name)
+        # The query cache is opened by every process that retrieves, so it locks across processes
+        self.embedder = load_embedder(cache_path, max_entries=max_cache_entries, shared=True)
+        # Lexical index written by docs_to_db.py (in chroma_path by default); without it queries are vector-only
+        bm25_path = bm25_path or default_bm25_path(chroma_path)
+        self.bm25 = BM25Index.load(bm25_path) if hybrid and os.path.isfile(bm25_path) else None
+        # Optional int8 index (quantized_index.py) that replaces Chroma's HNSW search
+        self.quantized = QuantizedIndex.load(quantized_path) if quantized_path else None
+
+    def warm_up(self):
+        """Runs one throwaway query so the model and HNSW index are resident"""
+        self.query(["warm up"], n_results=1)
+
+    def query(self, query_texts: List[str], n_results: int = 5) -> Dict:
+        """
+        Embeds all query texts in one call and probes the vector index once.
+        With a BM25 index loaded, the vector and lexical rankings of each
+        query are fused with reciprocal rank fusion; "distances" then holds
+        the negated fusion score (lower is still better).
+        """
+        with span("query", queries=len(query_texts), n_results=n_results, hybrid=self.bm25 is not None):
+            return self._query(query_texts, n_results)
+
+    def _query(self, query_texts: List[str], n_results: int) -> Dict:
+        if self.bm25 is None:
+            return self._vector_query(query_texts, n_results)
+
+        candidates = n_results * CANDIDATE_FACTOR
+        vector = self._vector_query(query_texts, candidates)
+        lookup = {}
+        for i in range(len(query_texts)):
+            for doc_id, document, metadata in zip(vector["ids"][i], vector["documents"][i], vector["metadatas"][i]):
+                lookup[doc_id] = (document, metadata)
+
+        fused = []
+        with span("query.bm25"):
+            for i, text in enumerate(query_texts):
+                lexical = [doc_id for doc_id, _ in self.bm25.search(text, candidates)]
+                fused.append(reciprocal_rank_fusion([vector["ids"][i], lexical])[:n_results])
+
+        # Lexical-only hits still need their text; fetch them all in one call
+        missing = sorted({doc_id for ranking in fused for doc_id, _ in ranking if doc_id not in lookup})
+        if missing:
+            fetched = self.collection.get(ids=missing, include=["documents", "metadatas"])
+            for doc_id, document, metadata in zip(fetched["ids"], fetched["documents"], fetched["metadatas"]):
+                lookup[doc_id] = (document, metadata)
+
+        fused = [[(doc_id, score) for doc_id, score in ranking if doc_id in lookup] for ranking in fused]
+        return {
+            "ids": [[doc_id for doc_id, _ in ranking] for ranking in fused],
+            "documents": [[lookup[doc_id][0] for doc_id, _ in ranking] for ranking in fused],
+            "metadatas": [[lookup[doc_id][1] for doc_id, _ in ranking] for ranking in fused],
+            "distances": [[-score for _, score in ranking] for ranking in fused]
+        }
+
+    def _vector_query(self, query_texts: List[str], n_results: int) -> Dict:
+        with span("query.embed", queries=len(query_texts)):
+            embeddings = self.embedder.encode(query_texts)
+        if self.quantized is None:
+            with span("query.vector"):
+                results = self.collection.query(query_embeddings=embeddings, n_results=n_results)
+            return {key: results.get(key) for key in RESULT_KEYS}
+
+        with span("query.vector", quantized=True):
+            # Re-ranked from the index's own float32 copy if it has one; ids deleted since the build drop out
+            results = self.quantized.search(embeddings, n_results)
+        fetched = self.collection.get(
+            ids=sorted({doc_id for ids in results["ids"] for doc_id in ids}),
+            include=["documents", "metadatas"]
+        )
+        lookup = {
+            doc_id: (document, metadata)
+            for doc_id, document, metadata in zip(fetched["ids"], fetched["documents"], fetched["metadatas"])
+        }
+        hits = [
+            [(doc_id, distance) for doc_id, distance in zip(ids, distances) if doc_id in lookup]
+            for ids, distances in zip(results["ids"], results["distances"])
+        ]
+        return {
+            "ids": [[doc_id for doc_id, _ in ranking] for ranking in hits],
+            "documents": [[lookup[doc_id][0] for doc_id, _ in ranking] for ranking in hits],
+            "metadatas": [[lookup[doc_id][1] for doc_id, _ in ranking] for ranking in hits],
+            "distances": [[distance for _, distance in ranking] for ranking in hits]
+        }
+
+    def close(self):
+        self.embedder.cache.flush()
+
+
+def scene_query_text(scene: ParsedScene) -> str:
+    return f"{scene.name}: {scene.raw_text}"
+
+
+def retrieve_scene_contexts(retriever, scenes: List[ParsedScene], n_results: int = 5,
+                            exclusive: bool = False) -> List[Dict]:
+    """
+    Retrieves docs for every scene of a parsed script with a single batched
+    query. retriever can be a Retriever or a RetrievalClient.
+
+    Hits are deduplicated across scenes by chunk id and by content, so a chunk
+    returned for several scenes is one shared dict. With exclusive=True each
+    chunk is kept only for the scene it matched best. Returns one
+    {"scene": ..., "documents": [...]} bundle per scene, in scene order, with
+    documents sorted by distance.
+    """
+    if not scenes:
+        return []
+
+    results = retriever.query([scene_query_text(scene) for scene in scenes], n_results=n_results)
+
+    hits = {}
+    content_ids = {}
+    scene_hits = []
+    for i in range(len(scenes)):
+        per_scene = {}
+        rows = zip(results["ids"][i], results["documents"][i], results["metadatas"][i], results["distances"][i])
+        for doc_id, content, metadata, distance in rows:
+            # Identical text stored under two ids (e.g. overlapping chunks) collapses to one hit
+            digest = hashlib.sha1(content.encode("utf-8")).hexdigest()
+            doc_id = content_ids.setdefault(digest, doc_id)
+            if doc_id not in hits:
+                hits[doc_id] = {"id": doc_id, "content": content, "metadata": metadata}
+            if doc_id not in per_scene or distance < per_scene[doc_id]:
+                per_scene[doc_id] = distance
+        scene_hits.append(per_scene)
+
+    if exclusive:
+        best_scene = {}
+        for i, per_scene in enumerate(scene_hits):
+            for doc_id, distance in per_scene.items():
+                if doc_id not in best_scene or distance < scene_hits[best_scene[doc_id]][doc_id]:
+                    best_scene[doc_id] = i
+        scene_hits = [
+            {doc_id: distance for doc_id, distance in per_scene.items() if best_scene[doc_id] == i}
+            for i, per_scene in enumerate(scene_hits)
+        ]
+
+    return [
+        {
+            "scene": scene,
+            "documents": [hits[doc_id] for doc_id, _ in sorted(per_scene.items(), key=lambda item: item[1])]
+        }
+        for scene, per_scene in zip(scenes, scene_hits)
+    ]
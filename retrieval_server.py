@@ -0,0 +1,234 @@
+import argparse
+import asyncio
+import http.client
+import json
+import socket
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+
+from retrieval import Retriever, RESULT_KEYS
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+
+class QueryBatcher:
+    """
+    Coalesces concurrent query requests into one embedding call and one
+    collection.query. The first waiting request opens a short window; every
+    request that arrives inside it (up to max_batch texts) rides along.
+    Requests in a window are run as one batch per distinct n_results.
+    """
+
+    def __init__(self, retriever: Retriever, max_batch: int = 64, window_ms: float = 5.0):
+        self.retriever = retriever
+        self.max_batch = max_batch
+        self.window = window_ms / 1000
+        self.queue = asyncio.Queue()
+
+    async def query(self, query_texts: List[str], n_results: int) -> Dict:
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((query_texts, n_results, future))
+        return await future
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            pending = [await self.queue.get()]
+            size = len(pending[0][0])
+            deadline = loop.time() + self.window
+            while size < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                pending.append(item)
+                size += len(item[0])
+
+            # Hybrid scores depend on how deep each side is fused, so a batch only shares one n_results
+            groups = {}
+            for item in pending:
+                groups.setdefault(item[1], []).append(item)
+            for n_results, group in groups.items():
+                await self._run_batch(group, n_results)
+
+    async def _run_batch(self, pending: List, n_results: int):
+        texts = [text for query_texts, _, _ in pending for text in query_texts]
+        try:
+            results = await asyncio.to_thread(self.retriever.query, texts, n_results)
+        except Exception as e:
+            for _, _, future in pending:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        # Hand each request back its own rows
+        offset = 0
+        for query_texts, _, future in pending:
+            rows = slice(offset, offset + len(query_texts))
+            if not future.done():
+                future.set_result({
+                    key: results[key][rows] if results.get(key) is not None else None
+                    for key in RESULT_KEYS
+                })
+            offset += len(query_texts)
+
+
+class RetrievalServer:
+    """
+    Resident retrieval service. Loads the collection and embedder once and
+    serves a small JSON-over-HTTP API on TCP or a Unix socket:
+
+        GET  /health   -> {"status": "ok", "warm": bool, "count": int}
+        POST /warmup   -> {"status": "ok"}
+        POST /query    {"query_texts": [...], "n_results": 5} -> Chroma-style results
+    """
+
+    def __init__(self, retriever: Retriever, max_batch: int = 64, window_ms: float = 5.0):
+        self.retriever = retriever
+        self.batcher = QueryBatcher(retriever, max_batch, window_ms)
+        self.warm = False
+
+    async def warm_up(self):
+        await asyncio.to_thread(self.retriever.warm_up)
+        self.warm = True
+
+    async def handle(self, method: str, path: str, body: bytes):
+        if method == "GET" and path == "/health":
+            count = await asyncio.to_thread(self.retriever.collection.count)
+            return 200, {"status": "ok", "warm": self.warm, "count": count}
+        if method == "POST" and path == "/warmup":
+            await self.warm_up()
+            return 200, {"status": "ok"}
+        if method == "POST" and path == "/query":
+            payload = json.loads(body or b"{}")
+            query_texts = payload.get("query_texts")
+            if not query_texts or not isinstance(query_texts, list):
+                return 400, {"error": "query_texts must be a non-empty list"}
+            n_results = int(payload.get("n_results", 5))
+            return 200, await self.batcher.query(query_texts, n_results)
+        return 404, {"error": f"no route for {method} {path}"}
+
+    async def _serve_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+                try:
+                    status, response = await self.handle(method, path, body)
+                except Exception as e:
+                    status, response = 500, {"error": str(e)}
+
+                data = json.dumps(response).encode("utf-8")
+                keep_alive = headers.get("connection", "").lower() != "close"
+                writer.write(
+                    f"HTTP/1.1 {status} {http.client.responses.get(status, '')}\r\n"
+                    f"Content-Type: application/json\r\n"
+                    f"Content-Length: {len(data)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1") + data
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionResetError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT,
+                    unix_socket: Optional[str] = None, warm_up: bool = True):
+        batch_task = asyncio.create_task(self.batcher.run())
+        if warm_up:
+            await self.warm_up()
+
+        if unix_socket:
+            server = await asyncio.start_unix_server(self._serve_connection, path=unix_socket)
+            print(f"Retrieval server listening on {unix_socket}")
+        else:
+            server = await asyncio.start_server(self._serve_connection, host, port)
+            print(f"Retrieval server listening on http://{host}:{port}")
+
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batch_task.cancel()
+            self.retriever.close()
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path: str, timeout: float):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+class RetrievalClient:
+    """
+    Blocking client for RetrievalServer. Accepts http://host:port or
+    unix:///path/to/socket as the server address.
+    """
+
+    def __init__(self, url: str = f"http://{DEFAULT_HOST}:{DEFAULT_PORT}", timeout: float = 30.0):
+        self.url = urlparse(url)
+        self.timeout = timeout
+
+    def _request(self, method: str, path: str, payload: Optional[Dict] = None) -> Dict:
+        if self.url.scheme == "unix":
+            conn = _UnixHTTPConnection(self.url.path, self.timeout)
+        else:
+            conn = http.client.HTTPConnection(self.url.hostname, self.url.port, timeout=self.timeout)
+        try:
+            body = json.dumps(payload).encode("utf-8") if payload is not None else None
+            conn.request(method, path, body=body, headers={"Content-Type": "application/json", "Connection": "close"})
+            response = conn.getresponse()
+            data = json.loads(response.read() or b"{}")
+            if response.status != 200:
+                raise RuntimeError(f"Retrieval server error {response.status}: {data.get('error')}")
+            return data
+        finally:
+            conn.close()
+
+    def health(self) -> Dict:
+        return self._request("GET", "/health")
+
+    def warm_up(self) -> Dict:
+        return self._request("POST", "/warmup", {})
+
+    def query(self, query_texts: List[str], n_results: int = 5) -> Dict:
+        return self._request("POST", "/query", {"query_texts": query_texts, "n_results": n_results})
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Serve Manim docs retrieval from a resident process.")
+    arg_parser.add_argument("--host", default=DEFAULT_HOST)
+    arg_parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    arg_parser.add_argument("--unix-socket", default=None)
+    arg_parser.add_argument("--chroma-path", default="./chroma_db")
+    arg_parser.add_argument("--max-batch", type=int, default=64)
+    arg_parser.add_argument("--window-ms", type=float, default=5.0)
+    arg_parser.add_argument("--quantized-path", default=None,
+                            help="Search the int8 index built by docs_to_db.py --quantized instead of Chroma's HNSW")
+    args = arg_parser.parse_args()
+
+    retriever = Retriever(chroma_path=args.chroma_path, quantized_path=args.quantized_path)
+    server = RetrievalServer(retriever, args.max_batch, args.window_ms)
+    try:
+        asyncio.run(server.serve(args.host, args.port, args.unix_socket))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,81 @@
+import re
+from dataclasses import dataclass, field
+from typing import List
+
+# Generic patterns that work for any educational content
+SCENE_MARKER = re.compile(r'\((\d+)\s*seconds\):')
+# A scene name starts after the last sentence end (or line break) before its marker
+NAME_BOUNDARY = re.compile(r'[.!?]\s+|\n')
+CONTENT_PATTERN = re.compile(
+    r'Text:\s*[\'"](?P<text>[^\'"]+)[\'"]'
+    r'|Animation:\s*(?P<animation>[^.]+)'
+    r'|Duration:\s*(?P<duration>[^.]+)'
+    r'|Transition:\s*(?P<transition>[^.]+)'
+)
+
+
+@dataclass(slots=True)
+class SceneContent:
+    texts: List[str] = field(default_factory=list)
+    animations: List[str] = field(default_factory=list)
+    transitions: List[str] = field(default_factory=list)
+    timings: List[str] = field(default_factory=list)
+
+
+@dataclass(slots=True)
+class ParsedScene:
+    """One scene of a script; offsets index into the original script string"""
+    name: str
+    duration: int
+    content: SceneContent
+    raw_text: str
+    start: int
+    content_start: int
+    end: int
+
+
+class GenericSceneParser:
+    def parse_script(self, script: str) -> List[ParsedScene]:
+        """Parse any educational script into structured scene data"""
+        # Locate every time marker, then the scene name in front of it
+        headers = []
+        previous_end = 0
+        for marker in SCENE_MARKER.finditer(script):
+            name_end = len(script[previous_end:marker.start()].rstrip()) + previous_end
+            name_start = previous_end
+            for boundary in NAME_BOUNDARY.finditer(script, previous_end, name_end):
+                name_start = boundary.end()
+            headers.append((name_start, name_end, int(marker.group(1)), marker.end()))
+            previous_end = marker.end()
+
+        scenes = []
+        for i, (name_start, name_end, duration, content_start) in enumerate(headers):
+            content_end = headers[i + 1][0] if i + 1 < len(headers) else len(script)
+            raw_text = script[content_start:content_end].strip()
+            scenes.append(ParsedScene(
+                name=script[name_start:name_end].strip(),
+                duration=duration,
+                content=self._parse_content(raw_text),
+                raw_text=raw_text,
+                start=name_start,
+                content_start=content_start,
+                end=content_end
+            ))
+
+        return scenes
+
+    def _parse_content(self, content: str) -> SceneContent:
+        """Parse the content of a scene into structured data in one scan"""
+        scene_content = SceneContent()
+        for match in CONTENT_PATTERN.finditer(content):
+            kind = match.lastgroup
+            value = match.group(kind)
+            if kind == 'text':
+                scene_content.texts.append(value)
+            elif kind == 'animation':
+                scene_content.animations.append(value)
+            elif kind == 'duration':
+                scene_content.timings.append(value)
+            else:
+                scene_content.transitions.append(value)
+        return scene_content
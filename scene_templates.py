@@ -0,0 +1,209 @@
+import re
+from typing import Dict, List, Optional
+
+from scene_parser import ParsedScene
+
+QUOTED_PATTERN = re.compile(r"'([^']*)'|\"([^\"]*)\"")
+PLACEHOLDER_PATTERN = re.compile(r'\x00(\d+)\x00')
+SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+LABEL_PATTERN = re.compile(r'([A-Z][A-Za-z ]{0,20}):\s*(.*)', re.DOTALL)
+ANIMATION_SECONDS_PATTERN = re.compile(r'(\d+(?:\.\d+)?)\s*seconds?\s+for\s+the\s+animations?\b')
+STAY_SECONDS_PATTERN = re.compile(r'(?:stays?|remains?)\s+on\s+screen\s+for\s+(\d+(?:\.\d+)?)\s*seconds?')
+FADE_OUT_PATTERN = re.compile(r'fades?\s+out\b|fadeout|disappear')
+WORD_PATTERN = re.compile(r'[a-z]+')
+
+HEADING_LABELS = {"text", "title", "main text"}
+SUBTITLE_LABELS = {"subtitle"}
+DISPLAY_LABELS = {"display"}
+ANIMATION_LABELS = {"animation", "animations"}
+# Every word of a templated scene must come from this list (quoted strings and numbers
+# aside); anything else (arrays, pointers, code, highlights...) is left to the LLM
+TEMPLATE_VOCABULARY = set("""
+a an the and then with of for on in at to is it its as both each all every one by sequence line lines
+text texts title titles subtitle subtitles main effect appear appears appearing write writes written
+fade fades fading fadein fadeout out disappear disappears stay stays remain remains screen second seconds
+pause pauses explanation animation animations simultaneously together below under center centre centered
+large larger small smaller font size displayed stacked vertically horizontally end after first
+""".split())
+FONT_SIZES = {"large": 48, "larger": 48, "small": 32, "smaller": 32}
+HEADING_FONT_SIZE = 48
+SUBTITLE_FONT_SIZE = 32
+DISPLAY_FONT_SIZE = 36
+DEFAULT_RUN_TIME = 1.0
+
+
+def _clauses(raw_text: str):
+    """Yields (label or None, lowercased text without quotes, quoted strings) per sentence"""
+    strings = []
+
+    def mask(match):
+        strings.append(match.group(1) if match.group(1) is not None else match.group(2))
+        return f"\x00{len(strings) - 1}\x00"
+
+    masked = QUOTED_PATTERN.sub(mask, raw_text.strip())
+    for sentence in SENTENCE_END.split(masked):
+        match = LABEL_PATTERN.match(sentence)
+        label, value = (match.group(1).strip().lower(), match.group(2)) if match else (None, sentence)
+        quoted = [strings[int(i)] for i in PLACEHOLDER_PATTERN.findall(value)]
+        text = PLACEHOLDER_PATTERN.sub(" ", value).lower()
+        yield label, text, quoted
+
+
+def _font_size(text: str, default: int) -> int:
+    for word in WORD_PATTERN.findall(text):
+        if word in FONT_SIZES:
+            return FONT_SIZES[word]
+    return default
+
+
+class _TemplateBuilder:
+    """Turns the sentences of one scene into Manim statements, tracking what is on screen"""
+
+    def __init__(self):
+        self.setup: List[str] = []
+        # ("play", [animations], closes the scene) or ("wait", seconds)
+        self.steps: List = []
+        # Declared but not yet animated in, and currently visible
+        self.pending: List[str] = []
+        self.on_screen: List[str] = []
+        self.groups = set()
+        self.count = 0
+
+    def add(self, expression: str, group: bool = False):
+        """Declares an element; it goes below whatever was declared or shown last, else in the center"""
+        name = f"text_{self.count}"
+        self.count += 1
+        visible = self.on_screen + self.pending
+        if visible:
+            expression += f".next_to({visible[-1]}, DOWN, buff=0.5)"
+        self.setup.append(f"{name} = {expression}")
+        self.pending.append(name)
+        if group:
+            self.groups.add(name)
+
+    def introduce(self, effect: str, lagged: bool = False) -> List[str]:
+        """Animates the pending elements in and returns their names"""
+        names, self.pending = self.pending, []
+        if not names:
+            return names
+        if lagged and len(names) == 1 and names[0] in self.groups:
+            animations = [f"LaggedStart(*[{effect}(line) for line in {names[0]}], lag_ratio=0.5)"]
+        elif lagged and len(names) > 1:
+            animations = [f"LaggedStart({', '.join(f'{effect}({name})' for name in names)}, lag_ratio=0.5)"]
+        else:
+            animations = [f"{effect}({name})" for name in names]
+        self.steps.append(("play", animations, False))
+        self.on_screen.extend(names)
+        return names
+
+    def fade_out(self, targets: List[str], closing: bool = False):
+        targets = [name for name in targets if name in self.on_screen]
+        if targets:
+            self.steps.append(("play", [f"FadeOut({name})" for name in targets], closing))
+            self.on_screen = [name for name in self.on_screen if name not in targets]
+
+
+def _animate(builder: _TemplateBuilder, text: str):
+    """Applies one animation sentence: intro effect, holds and fade-outs in the order written"""
+    lagged = bool(re.search(r'one by one|each line|in sequence', text))
+    introduced = []
+    for part in re.split(r',|\bthen\b', text):
+        if "write" in part:
+            introduced += builder.introduce("Write", lagged)
+        elif re.search(r'fades?\s+in\b|fadein|appear', part):
+            introduced += builder.introduce("FadeIn", lagged)
+        stay = STAY_SECONDS_PATTERN.search(part)
+        if stay:
+            introduced += builder.introduce("FadeIn", lagged)
+            builder.steps.append(("wait", float(stay.group(1))))
+        if FADE_OUT_PATTERN.search(part):
+            introduced += builder.introduce("FadeIn", lagged)
+            # "..., then fades out" removes what this sentence showed; "both"/"all" means everything
+            everything = not introduced or re.search(r'\b(?:both|all|every)\b', part)
+            builder.fade_out(list(builder.on_screen) if everything else introduced)
+
+
+def template_scene_code(scene: ParsedScene, index: int) -> Optional[str]:
+    """
+    Deterministic Manim code for scenes made only of titles, subtitles and
+    stacked text shown with Write/FadeIn and removed with FadeOut, or None
+    when the scene describes anything else and needs the LLM.
+    """
+    builder = _TemplateBuilder()
+    animation_seconds = None
+    for label, text, quoted in _clauses(scene.raw_text):
+        if any(word not in TEMPLATE_VOCABULARY for word in WORD_PATTERN.findall(text)):
+            return None
+        if label in HEADING_LABELS or label in SUBTITLE_LABELS:
+            if len(quoted) != 1:
+                return None
+            size = _font_size(text, SUBTITLE_FONT_SIZE if label in SUBTITLE_LABELS else HEADING_FONT_SIZE)
+            builder.add(f"Text({quoted[0]!r}, font_size={size})")
+        elif label in DISPLAY_LABELS:
+            if not quoted:
+                return None
+            size = _font_size(text, DISPLAY_FONT_SIZE)
+            if len(quoted) == 1:
+                builder.add(f"Text({quoted[0]!r}, font_size={size})")
+            else:
+                direction = "RIGHT" if "horizontally" in text else "DOWN"
+                lines = ", ".join(f"Text({line!r}, font_size={size})" for line in quoted)
+                builder.add(f"VGroup({lines}).arrange({direction}, buff=0.4)", group=True)
+        elif label in ANIMATION_LABELS or label is None:
+            if quoted:
+                return None
+            _animate(builder, text)
+        elif label == "duration":
+            seconds = ANIMATION_SECONDS_PATTERN.search(text)
+            if seconds:
+                animation_seconds = float(seconds.group(1))
+        elif label == "transition":
+            if quoted or not FADE_OUT_PATTERN.search(text):
+                return None
+            builder.introduce("FadeIn")
+            builder.fade_out(list(builder.on_screen), closing=True)
+        else:
+            return None
+
+    # Elements no sentence animated still have to appear
+    builder.introduce("FadeIn")
+    if builder.count == 0:
+        return None
+    return _render(builder, scene, index, animation_seconds)
+
+
+def _render(builder: _TemplateBuilder, scene: ParsedScene, index: int, animation_seconds: Optional[float]) -> str:
+    """Assigns run times so the scene lasts scene.duration seconds and emits the class"""
+    steps = builder.steps
+    animated = [step for step in steps if step[0] == "play" and not step[2]]
+    run_time = animation_seconds / len(animated) if animation_seconds and animated else DEFAULT_RUN_TIME
+    total = sum(run_time if not step[2] else DEFAULT_RUN_TIME for step in steps if step[0] == "play")
+    total += sum(step[1] for step in steps if step[0] == "wait")
+
+    # The rest of the scene's time is a pause before the closing fade-outs (or at the end)
+    closing = len(steps)
+    while closing > 0 and steps[closing - 1][0] == "play" and steps[closing - 1][1][0].startswith("FadeOut"):
+        closing -= 1
+    if closing == 0:
+        closing = len(steps)
+    pause = scene.duration - total
+
+    lines = [f"class Scene{index}(Scene):", "    def construct(self):"]
+    lines.extend(f"        {statement}" for statement in builder.setup)
+    for i, step in enumerate(steps):
+        if i == closing and pause > 0:
+            lines.append(f"        self.wait({pause:.2f})")
+        if step[0] == "wait":
+            lines.append(f"        self.wait({step[1]:.2f})")
+        else:
+            seconds = DEFAULT_RUN_TIME if step[2] else run_time
+            lines.append(f"        self.play({', '.join(step[1])}, run_time={seconds:.2f})")
+    if closing == len(steps) and pause > 0:
+        lines.append(f"        self.wait({pause:.2f})")
+    return "\n".join(lines)
+
+
+def template_coverage(scenes: List[ParsedScene]) -> Dict[str, int]:
+    """How many scenes of a script the templates cover"""
+    templated = sum(1 for i, scene in enumerate(scenes) if template_scene_code(scene, i) is not None)
+    return {"scenes": len(scenes), "templated": templated, "llm": len(scenes) - templated}
@@ -0,0 +1,221 @@
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+DEFAULT_PORT = 8799
+# The scene description inside a generate_scene_prompt prompt; repair prompts embed it too
+SCENE_DETAILS_PATTERN = re.compile(r'Scene Details:\n(.*?)\n\nScene Requirements:', re.DOTALL)
+REPAIR_MARKER = "failed validation before rendering"
+
+SCENE_TEMPLATE = '''```python
+from manim import *
+
+class Scene(Scene):
+    def construct(self):
+        title = Text("{name}", font_size=48)
+        self.play(Write(title))
+        self.wait(1)
+        self.play(FadeOut(title))
+```'''
+
+# Returned instead of a scene (per choice) with probability invalid_rate; fails static validation
+INVALID_SCENE = '''```python
+from manim import *
+
+class Scene(Scene):
+    def construct(self):
+        self.play(Write(Text("unterminated"))
+```'''
+
+
+def prompt_key(messages: List[Dict]) -> str:
+    """
+    Recorded responses are keyed on the scene description of a scene prompt,
+    so they still replay when retrieved docs or prompt wording change. Any
+    other prompt (repairs included) is keyed on the sha256 of the last user
+    message.
+    """
+    user_messages = [m["content"] for m in messages if m.get("role") == "user"]
+    prompt = user_messages[-1] if user_messages else ""
+    match = SCENE_DETAILS_PATTERN.search(prompt)
+    if match and REPAIR_MARKER not in prompt:
+        return match.group(1).strip()
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+
+def default_response(messages: List[Dict]) -> str:
+    prompt = messages[-1]["content"] if messages else ""
+    match = re.search(r'Scene Name:\s*(.+)', prompt)
+    name = match.group(1).strip() if match else "Stub Scene"
+    return SCENE_TEMPLATE.format(name=name.replace('"', '\\"'))
+
+
+class StubLLMServer:
+    """
+    Local OpenAI-compatible /chat/completions endpoint standing in for the
+    DeepSeek API. Replays recorded responses (a JSON file mapping prompt_key
+    to content; replayed counts the hits) and falls back to a minimal valid
+    scene. latency and
+    failure_rate let callers exercise concurrency and retry paths, and
+    invalid_rate replaces each returned choice with broken scene code at
+    that rate (for the validation and multi-candidate paths);
+    stream=True requests are answered as server-sent events, with
+    stream_delay seconds between chunks.
+    """
+
+    def __init__(self, port: int = DEFAULT_PORT, latency: float = 0.0, failure_rate: float = 0.0,
+                 recorded_path: Optional[str] = None, host: str = "127.0.0.1", stream_delay: float = 0.0,
+                 invalid_rate: float = 0.0):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.stream_delay = stream_delay
+        self.failure_rate = failure_rate
+        self.invalid_rate = invalid_rate
+        self.recorded = {}
+        if recorded_path:
+            with open(recorded_path, "r", encoding="utf-8") as f:
+                self.recorded = json.load(f)
+        self.requests = 0
+        self.replayed = 0
+        self._lock = threading.Lock()
+        self._httpd = None
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def respond(self, payload: Dict) -> Dict:
+        messages = payload.get("messages", [])
+        content = self.recorded.get(prompt_key(messages))
+        if content:
+            with self._lock:
+                self.replayed += 1
+        else:
+            content = default_response(messages)
+        prompt_tokens = sum(len(m.get("content", "").split()) for m in messages)
+        completion_tokens = len(content.split())
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": payload.get("model", "stub"),
+            "choices": [
+                {"index": i, "message": {"role": "assistant", "content": self._choice(content)},
+                 "finish_reason": "stop"}
+                for i in range(payload.get("n") or 1)
+            ],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens
+            }
+        }
+
+    def _choice(self, content: str) -> str:
+        return INVALID_SCENE if self.invalid_rate and random.random() < self.invalid_rate else content
+
+    def stream_events(self, payload: Dict, piece_size: int = 16):
+        """Yields server-sent event payloads for a stream=True request"""
+        response = self.respond(payload)
+        content = response["choices"][0]["message"]["content"]
+        base = {"id": response["id"], "object": "chat.completion.chunk",
+                "created": response["created"], "model": response["model"]}
+        for start in range(0, len(content), piece_size):
+            delta = {"content": content[start:start + piece_size]}
+            if start == 0:
+                delta["role"] = "assistant"
+            yield dict(base, choices=[{"index": 0, "delta": delta, "finish_reason": None}])
+        yield dict(base, choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}])
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status: int, body: Dict):
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _send_stream(self, payload: Dict):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                self.close_connection = True
+                for event in server.stream_events(payload):
+                    self.wfile.write(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+                    if server.stream_delay:
+                        time.sleep(server.stream_delay)
+                self.wfile.write(b"data: [DONE]\n\n")
+
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                with server._lock:
+                    server.requests += 1
+                if server.latency:
+                    time.sleep(server.latency)
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    self._send(404, {"error": {"message": f"unknown path {self.path}"}})
+                elif random.random() < server.failure_rate:
+                    self._send(500, {"error": {"message": "stub failure", "type": "server_error"}})
+                elif payload.get("stream"):
+                    self._send_stream(payload)
+                else:
+                    self._send(200, server.respond(payload))
+
+        return Handler
+
+    def start(self) -> "StubLLMServer":
+        self._httpd = ThreadingHTTPServer((self.host, self.port), self._handler())
+        self.port = self._httpd.server_address[1]
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Serve a local stand-in for the DeepSeek chat API.")
+    arg_parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    arg_parser.add_argument("--latency", type=float, default=0.0)
+    arg_parser.add_argument("--failure-rate", type=float, default=0.0)
+    arg_parser.add_argument("--recorded", default=None)
+    arg_parser.add_argument("--invalid-rate", type=float, default=0.0)
+    args = arg_parser.parse_args()
+
+    stub = StubLLMServer(args.port, args.latency, args.failure_rate, args.recorded,
+                         invalid_rate=args.invalid_rate).start()
+    print(f"Stub LLM server listening on {stub.base_url}")
+    try:
+        stub._thread.join()
+    except KeyboardInterrupt:
+        stub.stop()
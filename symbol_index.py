@@ -0,0 +1,223 @@
+import os
+import re
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+SYMBOL_INDEX_PATH = "./symbol_index.npz"
+
+# Reference pages are named after the object they document, e.g. reference/manim.animation.fading.FadeIn.html
+REFERENCE_PAGE_PATTERN = re.compile(r'(?:^|[\\/])manim(?:\.\w+)*\.(?P<name>\w+)\.html$')
+# CapWords names: classes, animations and scenes (ALL_CAPS constants such as UP are left out)
+CLASS_NAME_PATTERN = re.compile(r'\b[A-Z][a-z0-9]\w*\b|\b[A-Z]{2,}[a-z]\w*\b')
+METHOD_CALL_PATTERN = re.compile(r'\.\s*(?P<name>[a-z_][a-z0-9_]*)\s*\(')
+# Shell sessions and CLI output are code blocks too; only Python ones are indexed
+PYTHON_CODE_PATTERN = re.compile(r'^\s*(?:from|import|class|def|>>>)\s', re.M)
+# Longer blocks are whole module listings (_modules/ source pages), not examples
+MAX_EXAMPLE_CHARS = 4000
+# String literals and comments hold prose ("Welcome", "Show ..."), not API names
+STRING_OR_COMMENT_PATTERN = re.compile(r'\'\'\'.*?\'\'\'|""".*?"""|\'[^\'\n]*\'|"[^"\n]*"|#[^\n]*', re.S)
+
+
+def code_symbols(code: str) -> set:
+    """Class names used in a code block, plus called methods as '.name'"""
+    code = STRING_OR_COMMENT_PATTERN.sub(" ", code)
+    symbols = set(CLASS_NAME_PATTERN.findall(code))
+    symbols.update("." + match.group("name") for match in METHOD_CALL_PATTERN.finditer(code))
+    return symbols
+
+
+class SymbolIndexBuilder:
+    """Collects symbols from parsed doc records as they stream out of parse_manim_docs.py"""
+
+    def __init__(self):
+        self.pages: List[str] = []
+        self.examples: List[str] = []
+        self.example_pages: List[int] = []
+        self.definitions: Dict[str, int] = {}
+        self.postings = defaultdict(list)
+
+    def add(self, doc: Dict):
+        page_id = len(self.pages)
+        self.pages.append(doc["file_path"])
+        match = REFERENCE_PAGE_PATTERN.search(doc["file_path"])
+        if match:
+            self.definitions.setdefault(match.group("name"), page_id)
+        for code in doc["code_blocks"]:
+            if len(code) > MAX_EXAMPLE_CHARS or not PYTHON_CODE_PATTERN.search(code):
+                continue
+            example_id = len(self.examples)
+            self.examples.append(code.strip())
+            self.example_pages.append(page_id)
+            for symbol in code_symbols(code):
+                self.postings[symbol].append(example_id)
+
+    def build(self) -> "SymbolIndex":
+        # Class names must be documented (when reference pages were parsed) or used in two examples,
+        # which drops the example scenes' own class names
+        symbols = sorted(set(self.definitions) | {
+            symbol for symbol, examples in self.postings.items()
+            if symbol.startswith(".") or len(examples) > 1 or not self.definitions
+        })
+        index = SymbolIndex()
+        index.pages = list(self.pages)
+        index.symbols = {symbol: i for i, symbol in enumerate(symbols)}
+        index.definitions = np.array([self.definitions.get(symbol, -1) for symbol in symbols], dtype=np.int32)
+        index.symbol_offsets = np.zeros(len(symbols) + 1, dtype=np.int64)
+        index.symbol_offsets[1:] = np.cumsum([len(self.postings.get(symbol, ())) for symbol in symbols])
+        index.postings = np.array(
+            [example for symbol in symbols for example in self.postings.get(symbol, ())], dtype=np.int32
+        )
+        index.example_pages = np.array(self.example_pages, dtype=np.int32)
+        encoded = [example.encode("utf-8") for example in self.examples]
+        index.example_offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        index.example_offsets[1:] = np.cumsum([len(example) for example in encoded])
+        index.example_blob = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        return index
+
+
+class SymbolIndex:
+    """
+    Maps Manim API names to the reference page that documents them and the
+    doc code examples that use them. Everything lives in flat numpy arrays
+    (postings CSR-style, example code as one UTF-8 blob with offsets) in a
+    single .npz; lookups are a dict probe plus array slices.
+    """
+
+    def __init__(self):
+        self.pages: List[str] = []
+        self.symbols: Dict[str, int] = {}
+        self.definitions = np.zeros(0, dtype=np.int32)
+        self.symbol_offsets = np.zeros(1, dtype=np.int64)
+        self.postings = np.zeros(0, dtype=np.int32)
+        self.example_pages = np.zeros(0, dtype=np.int32)
+        self.example_offsets = np.zeros(1, dtype=np.int64)
+        self.example_blob = np.zeros(0, dtype=np.uint8)
+
+    @classmethod
+    def build(cls, docs: Iterable[Dict]) -> "SymbolIndex":
+        builder = SymbolIndexBuilder()
+        for doc in docs:
+            builder.add(doc)
+        return builder.build()
+
+    def __contains__(self, symbol: str) -> bool:
+        return symbol in self.symbols
+
+    def __len__(self) -> int:
+        return len(self.symbols)
+
+    def example(self, example_id: int) -> str:
+        start, end = self.example_offsets[example_id], self.example_offsets[example_id + 1]
+        return self.example_blob[start:end].tobytes().decode("utf-8")
+
+    def _example_rank(self, example_id: int):
+        start, end = self.example_offsets[example_id], self.example_offsets[example_id + 1]
+        is_scene = b"def construct" in self.example_blob[start:end].tobytes()
+        return not is_scene, end - start
+
+    def _example_ids(self, symbol: str) -> np.ndarray:
+        symbol_id = self.symbols.get(symbol)
+        if symbol_id is None:
+            return self.postings[:0]
+        return self.postings[self.symbol_offsets[symbol_id]:self.symbol_offsets[symbol_id + 1]]
+
+    def lookup(self, symbol: str, limit: int = 3) -> Optional[Dict]:
+        """
+        Returns {"symbol", "reference", "examples": [{"file_path", "code"}]}
+        or None for an unknown name. "VGroup.arrange" looks up the class's
+        reference page and the examples that use both VGroup and .arrange.
+        """
+        owner, _, method = symbol.rpartition(".")
+        if owner:
+            example_ids = np.intersect1d(self._example_ids(owner), self._example_ids("." + method))
+            if not len(example_ids):
+                example_ids = self._example_ids("." + method)
+            reference_symbol = owner
+        else:
+            example_ids = self._example_ids(symbol)
+            reference_symbol = symbol
+        symbol_id = self.symbols.get(reference_symbol)
+        page_id = self.definitions[symbol_id] if symbol_id is not None else -1
+        if page_id < 0 and not len(example_ids):
+            return None
+
+        # Complete scenes before doctest snippets, shortest first within each
+        example_ids = sorted(example_ids.tolist(), key=self._example_rank)
+        return {
+            "symbol": symbol,
+            "reference": self.pages[page_id] if page_id >= 0 else None,
+            "examples": [
+                {"file_path": self.pages[self.example_pages[i]], "code": self.example(i)}
+                for i in example_ids[:limit]
+            ]
+        }
+
+    def symbols_in(self, text: str) -> List[str]:
+        """
+        Documented class names mentioned in free text such as a scene
+        description, in order of appearance. Only names with a reference page
+        count, so capitalized prose ("Then", "Show") does not match, and
+        script labels like "Text:" are not mentions.
+        """
+        found = []
+        for match in CLASS_NAME_PATTERN.finditer(text):
+            name = match.group(0)
+            symbol_id = self.symbols.get(name)
+            if symbol_id is None or self.definitions[symbol_id] < 0 or text.startswith(":", match.end()):
+                continue
+            if name not in found:
+                found.append(name)
+        return found
+
+    def save(self, path: str = SYMBOL_INDEX_PATH):
+        tmp_path = path + ".tmp.npz"
+        names = sorted(self.symbols, key=self.symbols.get)
+        np.savez(
+            tmp_path,
+            pages=np.array(self.pages, dtype=str),
+            symbols=np.array(names, dtype=str),
+            definitions=self.definitions,
+            symbol_offsets=self.symbol_offsets,
+            postings=self.postings,
+            example_pages=self.example_pages,
+            example_offsets=self.example_offsets,
+            example_blob=self.example_blob
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str = SYMBOL_INDEX_PATH) -> "SymbolIndex":
+        with np.load(path) as data:
+            index = cls()
+            index.pages = data["pages"].tolist()
+            index.symbols = {symbol: i for i, symbol in enumerate(data["symbols"].tolist())}
+            index.definitions = data["definitions"]
+            index.symbol_offsets = data["symbol_offsets"]
+            index.postings = data["postings"]
+            index.example_pages = data["example_pages"]
+            index.example_offsets = data["example_offsets"]
+            index.example_blob = data["example_blob"]
+        return index
+
+
+def symbol_documents(index: SymbolIndex, text: str, max_symbols: int = 5, examples_per_symbol: int = 1) -> List[Dict]:
+    """
+    Doc examples for the Manim names mentioned in text, in the
+    {"id", "content", "metadata"} shape used by retrieval results.
+    """
+    documents = []
+    seen = set()
+    for symbol in index.symbols_in(text)[:max_symbols]:
+        # Symbols often share their best example; take the next one instead of repeating it
+        entry = index.lookup(symbol, limit=examples_per_symbol + len(seen))
+        examples = [example for example in entry["examples"] if example["code"] not in seen]
+        for example in examples[:examples_per_symbol]:
+            seen.add(example["code"])
+            documents.append({
+                "id": f"symbol:{symbol}:{example['file_path']}",
+                "content": example["code"],
+                "metadata": {"source": example["file_path"], "symbol": symbol}
+            })
+    return documents
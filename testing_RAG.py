@@ -1,7 +1,9 @@
-import chromadb
 from transformers import AutoTokenizer, AutoModelForCausalLM
 from openai import OpenAI
 from dotenv import load_dotenv
+from retrieval import Retriever
+from retrieval_server import RetrievalClient
+from context_builder import build_context, format_context, count_tokens
 import os
 
 load_dotenv()
@@ -10,23 +12,27 @@ api_key = os.getenv('API_KEY')
 client_llm = OpenAI(api_key=api_key, base_url="https://api.deepseek.com")
 #print(client_llm.models.list())
 
-client = chromadb.PersistentClient(path="./chroma_db")
+query_texts = ["Teach how to use the binary search algorithm to efficiently find a target value in a sorted array, with step-by-step examples, Python code implementation, and complexity analysis."]
 
-# Load the collection
-collection = client.get_collection("manim_docs")
-print("Collection loaded successfully!")
-
-results = collection.query(
-    query_texts=["Teach how to use the binary search algorithm to efficiently find a target value in a sorted array, with step-by-step examples, Python code implementation, and complexity analysis."],
-    n_results=5
-)
+retrieval_url = os.getenv('RETRIEVAL_URL')
+if retrieval_url:
+    # A resident retrieval_server.py already has the model and index loaded
+    results = RetrievalClient(retrieval_url).query(query_texts, n_results=5)
+else:
+    retriever = Retriever()
+    print("Collection loaded successfully!")
+    results = retriever.query(query_texts, n_results=5)
+    retriever.close()
 
 # Print the results
 
-combined_documents = ""
-for i, doc in enumerate(results['documents'], start=1):
-    doc_content = "\n".join(doc)
-    combined_documents += f"\n--- Document {i} ---\n{doc_content}\n"
+# Merge overlapping chunks, drop near-duplicates and keep the prompt within a token budget
+hits = [
+    {"id": doc_id, "content": content, "metadata": metadata}
+    for doc_id, content, metadata in zip(results['ids'][0], results['documents'][0], results['metadatas'][0])
+]
+combined_documents = format_context(build_context(hits, token_budget=1500))
+print(f"Context: {count_tokens(combined_documents)} tokens from {len(hits)} retrieved chunks")
 
 #print(combined_documents)
 
@@ -0,0 +1,357 @@
+import atexit
+import contextvars
+import functools
+import inspect
+import json
+import multiprocessing.util
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: merges are not locked
+    fcntl = None
+
+TRACE_JSON_ENV = "EDUTOK_TRACE_JSON"
+PROMETHEUS_ENV = "EDUTOK_PROMETHEUS"
+PROFILE_ENV = "EDUTOK_PROFILE"
+PROFILER_ENV = "EDUTOK_PROFILER"
+PROFILE_DIR_ENV = "EDUTOK_PROFILE_DIR"
+METRIC_PREFIX = "edutok"
+
+_current_span = contextvars.ContextVar("edutok_current_span", default=None)
+
+
+class Span:
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "attributes", "start", "seconds", "error")
+
+    def __init__(self, name: str, parent: Optional["Span"], attributes: Dict):
+        self.name = name
+        self.span_id = uuid.uuid4().hex[:16]
+        # Spans opened outside any other span start a new trace (e.g. one per video)
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex
+        self.parent_id = parent.span_id if parent else None
+        self.attributes = attributes
+        self.start = time.time()
+        self.seconds = 0.0
+        self.error = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def to_dict(self) -> Dict:
+        return {
+            "name": self.name, "trace_id": self.trace_id, "span_id": self.span_id, "parent_id": self.parent_id,
+            "start": self.start, "seconds": self.seconds, "error": self.error, "attributes": self.attributes
+        }
+
+
+class JsonLogExporter:
+    """Appends one JSON object per finished span (and per counter increment) to a log file"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _write(self, record: Dict):
+        line = json.dumps(record, default=str) + "\n"
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line)
+
+    def export_span(self, span: Span):
+        self._write(dict(span.to_dict(), type="span"))
+
+    def export_count(self, name: str, value: float, labels: Dict, span: Optional[Span]):
+        self._write({"type": "count", "name": name, "value": value, "labels": labels,
+                     "trace_id": span.trace_id if span else None, "time": time.time()})
+
+    def flush(self, tracer: "Tracer"):
+        pass
+
+
+def _label_value(value) -> str:
+    """Escapes a label value for the Prometheus text format"""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class PrometheusExporter:
+    """
+    Writes the tracer's totals in the Prometheus text format, for the node
+    exporter's textfile collector. Every process (pool workers included)
+    saves its own totals under <path>.d/ on flush, then merges all of them
+    into the file under a lock and rewrites it atomically. Totals accumulate
+    across runs; delete <path>.d to reset them.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.state_dir = path + ".d"
+        self.state_path = os.path.join(self.state_dir, f"{os.getpid()}-{uuid.uuid4().hex[:8]}.json")
+
+    def export_span(self, span: Span):
+        pass
+
+    def export_count(self, name: str, value: float, labels: Dict, span: Optional[Span]):
+        pass
+
+    def _merged(self):
+        spans = defaultdict(lambda: [0, 0.0, 0])
+        counters = defaultdict(float)
+        for file_name in os.listdir(self.state_dir):
+            if not file_name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.state_dir, file_name), "r", encoding="utf-8") as f:
+                    state = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for name, totals in state["spans"].items():
+                for i, value in enumerate(totals):
+                    spans[name][i] += value
+            for name, labels, value in state["counters"]:
+                counters[(name, tuple(tuple(label) for label in labels))] += value
+        return spans, counters
+
+    def flush(self, tracer: "Tracer"):
+        spans, counters = tracer.snapshot()
+        if not spans and not counters and not os.path.exists(self.state_path):
+            return
+        os.makedirs(self.state_dir, exist_ok=True)
+        tmp_state = self.state_path + ".tmp"
+        with open(tmp_state, "w", encoding="utf-8") as f:
+            json.dump({"spans": spans, "counters": [[name, labels, value] for (name, labels), value in counters.items()]}, f)
+        os.replace(tmp_state, self.state_path)
+
+        with open(self.path + ".lock", "w") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            spans, counters = self._merged()
+            lines = [
+                f"# HELP {METRIC_PREFIX}_span_seconds Wall time spent in each instrumented stage.",
+                f"# TYPE {METRIC_PREFIX}_span_seconds summary"
+            ]
+            for name, (count, total, errors) in sorted(spans.items()):
+                lines.append(f'{METRIC_PREFIX}_span_seconds_sum{{span="{_label_value(name)}"}} {total:.6f}')
+                lines.append(f'{METRIC_PREFIX}_span_seconds_count{{span="{_label_value(name)}"}} {count}')
+            lines.append(f"# TYPE {METRIC_PREFIX}_span_errors_total counter")
+            for name, (count, total, errors) in sorted(spans.items()):
+                lines.append(f'{METRIC_PREFIX}_span_errors_total{{span="{_label_value(name)}"}} {errors}')
+
+            for metric in sorted({name for name, _ in counters}):
+                lines.append(f"# TYPE {METRIC_PREFIX}_{metric}_total counter")
+                for (name, labels), value in sorted(counters.items()):
+                    if name == metric:
+                        label_text = ",".join(f'{key}="{_label_value(val)}"' for key, val in labels)
+                        lines.append(f"{METRIC_PREFIX}_{name}_total{{{label_text}}} {value:g}")
+
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+            os.replace(tmp_path, self.path)
+
+
+class ProfilerHook:
+    """
+    Profiles the spans named in `stages` with cProfile (one .prof file per
+    span) or, if installed, pyinstrument (one .html file per span). Only one
+    span is profiled at a time; spans that start while another is being
+    profiled run unprofiled.
+    """
+
+    def __init__(self, stages: Iterable[str], output_dir: str = "./profiles", backend: str = "cprofile"):
+        self.stages = set(stages)
+        self.output_dir = output_dir
+        self.backend = backend
+        self._active = None
+        self._lock = threading.Lock()
+
+    def start(self, span: Span):
+        if span.name not in self.stages:
+            return
+        with self._lock:
+            if self._active is not None:
+                return
+            if self.backend == "pyinstrument":
+                from pyinstrument import Profiler
+                profiler = Profiler()
+                profiler.start()
+            else:
+                import cProfile
+                profiler = cProfile.Profile()
+                profiler.enable()
+            self._active = (span.span_id, profiler)
+
+    def stop(self, span: Span):
+        with self._lock:
+            if self._active is None or self._active[0] != span.span_id:
+                return
+            profiler = self._active[1]
+            self._active = None
+        os.makedirs(self.output_dir, exist_ok=True)
+        base = os.path.join(self.output_dir, f"{span.name}-{span.span_id}")
+        if self.backend == "pyinstrument":
+            profiler.stop()
+            with open(base + ".html", "w", encoding="utf-8") as f:
+                f.write(profiler.output_html())
+        else:
+            profiler.disable()
+            profiler.dump_stats(base + ".prof")
+
+
+class Tracer:
+    """
+    Spans and counters for the pipeline stages. Every finished span is
+    aggregated in memory (count, total seconds, errors per name) and handed
+    to the exporters; with no exporters a span costs a few microseconds.
+    """
+
+    def __init__(self, exporters: Optional[List] = None, profiler: Optional[ProfilerHook] = None):
+        self.exporters = list(exporters or [])
+        self.profiler = profiler
+        self._lock = threading.Lock()
+        self._spans = defaultdict(lambda: [0, 0.0, 0])
+        self._counters = defaultdict(float)
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        span = Span(name, _current_span.get(), attributes)
+        token = _current_span.set(span)
+        if self.profiler is not None:
+            self.profiler.start(span)
+        started = time.perf_counter()
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            span.seconds = time.perf_counter() - started
+            if self.profiler is not None:
+                self.profiler.stop(span)
+            _current_span.reset(token)
+            self._finish(span)
+
+    def record(self, name: str, seconds: float, error: Optional[str] = None, **attributes):
+        """Adds a span timed elsewhere, e.g. a scene rendered on a worker process"""
+        span = Span(name, _current_span.get(), attributes)
+        span.start -= seconds
+        span.seconds = seconds
+        span.error = error
+        self._finish(span)
+
+    def count(self, name: str, value: float = 1, **labels):
+        """Increments a counter such as llm_tokens{kind="prompt"}"""
+        if not value:
+            return
+        key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+        with self._lock:
+            self._counters[key] += value
+        span = _current_span.get()
+        for exporter in self.exporters:
+            exporter.export_count(name, value, labels, span)
+
+    def _finish(self, span: Span):
+        with self._lock:
+            totals = self._spans[span.name]
+            totals[0] += 1
+            totals[1] += span.seconds
+            totals[2] += span.error is not None
+        for exporter in self.exporters:
+            exporter.export_span(span)
+
+    def snapshot(self):
+        """({span name: (count, total seconds, errors)}, {(counter, labels): value})"""
+        with self._lock:
+            return {name: tuple(totals) for name, totals in self._spans.items()}, dict(self._counters)
+
+    def flush(self):
+        for exporter in self.exporters:
+            exporter.flush(self)
+
+
+def tracer_from_env() -> Tracer:
+    """
+    EDUTOK_TRACE_JSON=<path> logs spans as JSON lines, EDUTOK_PROMETHEUS=<path>
+    writes a Prometheus text file at exit (merged over every process), and EDUTOK_PROFILE=embed,render
+    profiles those spans (EDUTOK_PROFILER=pyinstrument to switch backends,
+    EDUTOK_PROFILE_DIR for the output directory).
+    """
+    exporters = []
+    if os.getenv(TRACE_JSON_ENV):
+        exporters.append(JsonLogExporter(os.environ[TRACE_JSON_ENV]))
+    if os.getenv(PROMETHEUS_ENV):
+        exporters.append(PrometheusExporter(os.environ[PROMETHEUS_ENV]))
+    profiler = None
+    if os.getenv(PROFILE_ENV):
+        profiler = ProfilerHook(
+            [stage.strip() for stage in os.environ[PROFILE_ENV].split(",") if stage.strip()],
+            os.getenv(PROFILE_DIR_ENV, "./profiles"),
+            os.getenv(PROFILER_ENV, "cprofile")
+        )
+    return Tracer(exporters, profiler)
+
+
+_tracer = None
+
+
+def get_tracer() -> Tracer:
+    """This process's tracer, configured from the environment on first use"""
+    global _tracer
+    if _tracer is None:
+        _tracer = tracer_from_env()
+        atexit.register(_tracer.flush)
+        # Pool workers leave through os._exit, which skips atexit but runs multiprocessing finalizers
+        multiprocessing.util.Finalize(None, _tracer.flush, exitpriority=10)
+    return _tracer
+
+
+def _reset_after_fork():
+    # A forked child starts its own tracer instead of re-counting the parent's totals
+    global _tracer
+    _tracer = None
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def set_tracer(tracer: Tracer) -> Tracer:
+    """Replaces the process tracer, e.g. to collect spans in a benchmark"""
+    global _tracer
+    _tracer = tracer
+    return tracer
+
+
+def span(name: str, **attributes):
+    return get_tracer().span(name, **attributes)
+
+
+def traced(name: str):
+    """Decorator that runs each call of a function or coroutine function in a span"""
+    def decorate(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def record_usage(usage, **labels):
+    """Counts the prompt and completion tokens of an OpenAI-style usage object"""
+    if usage is None:
+        return
+    tracer = get_tracer()
+    tracer.count("llm_tokens", getattr(usage, "prompt_tokens", 0) or 0, kind="prompt", **labels)
+    tracer.count("llm_tokens", getattr(usage, "completion_tokens", 0) or 0, kind="completion", **labels)
@@ -0,0 +1,233 @@
+import ast
+import builtins
+import threading
+import traceback
+from concurrent.futures import CancelledError, ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional, Set, Tuple
+
+MANIM_IMPORT = "from manim import *"
+
+_manim_names = None
+
+
+def manim_names() -> Optional[Set[str]]:
+    """Names exported by `from manim import *`, or None if manim is not installed"""
+    global _manim_names
+    if _manim_names is None:
+        try:
+            import manim
+        except ImportError:
+            return None
+        _manim_names = set(getattr(manim, "__all__", None) or dir(manim))
+    return _manim_names
+
+
+def _with_manim_import(code: str) -> str:
+    return code if MANIM_IMPORT in code else f"{MANIM_IMPORT}\n\n{code}"
+
+
+def _defined_names(tree: ast.AST) -> Set[str]:
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and isinstance(node.ctx, (ast.Store, ast.Del)):
+            names.add(node.id)
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            names.add(node.name)
+        elif isinstance(node, ast.arg):
+            names.add(node.arg)
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            names.update((alias.asname or alias.name).split(".")[0] for alias in node.names)
+        elif isinstance(node, ast.ExceptHandler) and node.name:
+            names.add(node.name)
+    return names
+
+
+def scene_class_names(tree: ast.Module) -> List[str]:
+    return [
+        node.name for node in tree.body
+        if isinstance(node, ast.ClassDef)
+        and any(isinstance(item, ast.FunctionDef) and item.name == "construct" for item in node.body)
+    ]
+
+
+def static_check(code: str, known_names: Optional[Set[str]] = None) -> List[str]:
+    """
+    Parses the scene code and reports syntax errors, a missing Scene class
+    with construct(), and names that are neither defined in the code, nor
+    builtins, nor exported by manim. Takes milliseconds.
+    """
+    try:
+        tree = ast.parse(_with_manim_import(code))
+    except SyntaxError as e:
+        return [f"SyntaxError: {e.msg} (line {e.lineno})"]
+
+    errors = []
+    if not scene_class_names(tree):
+        errors.append("No Scene class with a construct() method")
+
+    known_names = known_names if known_names is not None else manim_names()
+    if known_names is not None:
+        defined = _defined_names(tree) | set(dir(builtins)) | known_names
+        undefined = sorted({
+            node.id for node in ast.walk(tree)
+            if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load) and node.id not in defined
+        })
+        errors.extend(f"Undefined name: {name}" for name in undefined)
+    return errors
+
+
+def dry_run_scene(code: str, scene_name: str) -> Optional[str]:
+    """
+    Runs construct() with nothing written to disk and every animation skipped
+    to its end state, so errors surface without rendering a single frame.
+    Returns None on success or the error message.
+    """
+    from manim import tempconfig
+
+    filename = f"<{scene_name}>"
+    try:
+        namespace = {"__name__": "generated_scene"}
+        exec(compile(_with_manim_import(code), filename, "exec"), namespace)
+        with tempconfig({"dry_run": True, "quality": "low_quality", "disable_caching": True}):
+            scene = namespace[scene_name]()
+            # Cairo renderer: jump each play() to its final state instead of rendering frames
+            scene.renderer.skip_animations = True
+            scene.renderer.update_skipping_status = lambda: None
+            scene.render()
+        return None
+    except Exception as e:
+        # Report the deepest line of the scene itself, not of manim internals
+        frames = traceback.extract_tb(e.__traceback__)
+        scene_frames = [frame for frame in frames if frame.filename == filename]
+        frame = (scene_frames or frames)[-1]
+        lineno = frame.lineno
+        if scene_frames and MANIM_IMPORT not in code:
+            # Line numbers of the code as given, without the import _with_manim_import added
+            lineno -= _with_manim_import(code).count("\n") - code.count("\n")
+        return f"{type(e).__name__}: {e} (line {lineno})"
+
+
+class ValidationPool:
+    """
+    Worker processes for dry runs. A dry run that hangs past its timeout
+    (or crashes its worker) gets the workers killed and replaced, so it
+    cannot keep a worker busy for later scenes.
+    """
+
+    def __init__(self, workers: Optional[int] = None):
+        self.workers = workers
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _current(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            return self._executor
+
+    def _reset(self, executor: ProcessPoolExecutor) -> bool:
+        """Kills executor's workers unless it was already replaced; True if this call did it"""
+        with self._lock:
+            if self._executor is not executor:
+                return False
+            self._executor = None
+        # ProcessPoolExecutor cannot cancel a running call, so terminate its processes
+        for process in list((executor._processes or {}).values()):
+            process.terminate()
+        executor.shutdown(wait=False, cancel_futures=True)
+        return True
+
+    def run(self, code: str, scene_name: str, timeout: float) -> Optional[str]:
+        """dry_run_scene on a worker, with the error, timeout or crash as the message"""
+        while True:
+            executor = self._current()
+            try:
+                future = executor.submit(dry_run_scene, code, scene_name)
+            except (BrokenProcessPool, RuntimeError):
+                self._reset(executor)
+                continue
+            try:
+                return future.result(timeout=timeout)
+            except TimeoutError:
+                self._reset(executor)
+                return f"Dry run of {scene_name} timed out after {timeout:.0f}s"
+            except (BrokenProcessPool, CancelledError):
+                # Killed because another scene timed out: run this one again
+                if self._reset(executor):
+                    return f"Dry run of {scene_name} crashed its worker process"
+
+    def run_many(self, jobs: List[Tuple[str, str]], timeout: float) -> List[Optional[str]]:
+        """
+        Runs (code, scene_name) dry runs concurrently. When one times out
+        the workers are replaced and the unfinished runs submitted again.
+        """
+        results = [None] * len(jobs)
+        pending = list(range(len(jobs)))
+        while pending:
+            executor = self._current()
+            futures = [(i, executor.submit(dry_run_scene, *jobs[i])) for i in pending]
+            pending = []
+            for position, (i, future) in enumerate(futures):
+                try:
+                    results[i] = future.result(timeout=timeout)
+                    continue
+                except TimeoutError:
+                    results[i] = f"Dry run of {jobs[i][1]} timed out after {timeout:.0f}s"
+                except (BrokenProcessPool, CancelledError):
+                    results[i] = f"Dry run of {jobs[i][1]} crashed its worker process"
+                self._reset(executor)
+                for j, other in futures[position + 1:]:
+                    if other.done() and not other.cancelled() and other.exception() is None:
+                        results[j] = other.result()
+                    else:
+                        pending.append(j)
+                break
+        return results
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown()
+
+
+def validate_scene_code(code: str, dry_run: bool = True, known_names: Optional[Set[str]] = None,
+                        pool: Optional[ValidationPool] = None, timeout: float = 30.0) -> List[str]:
+    """
+    Static checks first; if they pass and dry_run is set, a dry construct()
+    pass for each scene class (on pool if given, otherwise in-process).
+    Returns a list of error messages, empty when the code looks renderable.
+    """
+    errors = static_check(code, known_names)
+    if errors or not dry_run or manim_names() is None:
+        return errors
+
+    for scene_name in scene_class_names(ast.parse(_with_manim_import(code))):
+        error = dry_run_scene(code, scene_name) if pool is None else pool.run(code, scene_name, timeout)
+        if error:
+            errors.append(f"{scene_name}: {error}")
+    return errors
+
+
+def validate_scenes(scene_codes: List[str], dry_run: bool = True, workers: Optional[int] = None,
+                    timeout: float = 30.0) -> List[Dict]:
+    """Validates many scenes at once; the dry runs all run concurrently on a process pool"""
+    results = [{"index": i, "errors": static_check(code)} for i, code in enumerate(scene_codes)]
+    if not dry_run or manim_names() is None:
+        return results
+
+    runs = [
+        (result, code, scene_name)
+        for result, code in zip(results, scene_codes) if not result["errors"]
+        for scene_name in scene_class_names(ast.parse(_with_manim_import(code)))
+    ]
+    pool = ValidationPool(workers)
+    try:
+        errors = pool.run_many([(code, scene_name) for _, code, scene_name in runs], timeout)
+    finally:
+        pool.shutdown()
+    for (result, _, scene_name), error in zip(runs, errors):
+        if error:
+            result["errors"].append(f"{scene_name}: {error}")
+    return results